@@ -0,0 +1,48 @@
+"""The backend app with Gemini replaced by a local stand-in, for offline load tests
+
+    FAKE_GEMINI_LATENCY=1.5 uvicorn benchmarks.fake_gemini:app --port 8000
+
+FakeGenerativeModel answers after FAKE_GEMINI_LATENCY seconds (+/- FAKE_GEMINI_JITTER,
+uniform), fails with probability FAKE_GEMINI_ERROR_RATE (exercising the warm_vintage
+fallback) and otherwise recommends a random look with the mkl method.
+"""
+import asyncio
+import os
+import random
+from types import SimpleNamespace
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+import main
+
+FAKE_GEMINI_LATENCY = float(os.getenv("FAKE_GEMINI_LATENCY", "1.0"))
+FAKE_GEMINI_JITTER = float(os.getenv("FAKE_GEMINI_JITTER", "0.2"))
+FAKE_GEMINI_ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0.0"))
+
+_random = random.Random(int(os.getenv("FAKE_GEMINI_SEED", "0")))
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel implementing generate_content_async"""
+
+    def __init__(self, model_name: str, *args, **kwargs):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, generation_config=None):
+        latency = FAKE_GEMINI_LATENCY + _random.uniform(-FAKE_GEMINI_JITTER, FAKE_GEMINI_JITTER)
+        await asyncio.sleep(max(latency, 0.0))
+        if _random.random() < FAKE_GEMINI_ERROR_RATE:
+            raise RuntimeError("Fake Gemini error")
+        return SimpleNamespace(text=json.dumps({
+            "analysis": "Fake analysis for load testing",
+            "cinematic_look": _random.choice(list(main.CINEMATIC_LOOKS)),
+            "method": "mkl",
+            "confidence": 0.9
+        }))
+
+
+main.genai.GenerativeModel = FakeGenerativeModel
+app = main.app
@@ -0,0 +1,205 @@
+"""Load-test /api/generate-lut end to end against a local server with a fake Gemini
+
+For every LUT worker count, starts `uvicorn benchmarks.fake_gemini:app` in a subprocess,
+then for every concurrency level sends --requests uploads from that many client threads
+and reports p50/p95/p99 latency, requests/sec and the share of 503 (busy) responses.
+Every upload is a distinct image and near-duplicate reuse is disabled, so each request pays
+for Gemini and LUT generation unless --cache-hits is given. Entirely offline; run from the
+backend directory:
+
+    python -m benchmarks.load_test --workers 0,1,2 --concurrency 1,4,16 --gemini-latency 1.0
+"""
+import argparse
+import http.client
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+from PIL import Image
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from benchmarks.tile_scaling import synthetic_image
+
+
+def upload_bodies(count: int, size: str, unique: bool) -> list:
+    """count JPEG uploads of a synthetic image, made distinct by a JPEG comment if unique
+
+    Same pixels, different bytes: every upload misses the content-addressed caches while
+    costing the same to process.
+    """
+    height, width = (int(value) for value in size.split("x"))
+    image = Image.fromarray((synthetic_image(height, width) * 255).astype(np.uint8))
+    bodies = []
+    for index in range(count if unique else 1):
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90, comment=f"load-test {index}")
+        bodies.append(buffer.getvalue())
+    return bodies if unique else bodies * count
+
+
+def multipart_request(image_data: bytes) -> tuple:
+    """Return (headers, body) for a multipart/form-data upload of image_data as "file" """
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="load.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + image_data + f"\r\n--{boundary}--\r\n".encode()
+    return {"Content-Type": f"multipart/form-data; boundary={boundary}"}, body
+
+
+def start_server(port: int, workers: int, env: dict) -> subprocess.Popen:
+    """Start the fake-Gemini app with the given LUT worker count and wait until it is healthy"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.fake_gemini:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env, "LUT_WORKERS": str(workers)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("Server did not become healthy")
+
+
+def run_load(port: int, requests: list, concurrency: int, path: str) -> tuple:
+    """Send the prepared (headers, body) requests from concurrency threads
+
+    Returns (latencies of 200 responses in seconds, {status: count}, wall time).
+    """
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    next_request = iter(range(len(requests)))
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+        while True:
+            with lock:
+                index = next(next_request, None)
+            if index is None:
+                break
+            headers, body = requests[index]
+            start = time.perf_counter()
+            try:
+                connection.request("POST", path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+                status = "error"
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - start
+
+
+def main_load_test():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="0,1", help="LUT_WORKERS values to test")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=48, help="Requests per concurrency level")
+    parser.add_argument("--size", default="768x1024", help="HEIGHTxWIDTH of the uploaded images")
+    parser.add_argument("--lut-size", type=int, default=33)
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Mean fake Gemini latency in seconds")
+    parser.add_argument("--gemini-jitter", type=float, default=0.2)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--cache-hits", action="store_true", help="Upload one image repeatedly instead of distinct ones")
+    parser.add_argument("--max-queued-jobs", type=int, help="LUT_MAX_QUEUED_JOBS for the server (default: its own)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    concurrency_levels = [int(value) for value in args.concurrency.split(",")]
+    bodies = upload_bodies(
+        args.requests * len(concurrency_levels) + max(concurrency_levels), args.size, not args.cache_hits
+    )
+    server_env = {
+        "FAKE_GEMINI_LATENCY": str(args.gemini_latency),
+        "FAKE_GEMINI_JITTER": str(args.gemini_jitter),
+        "FAKE_GEMINI_ERROR_RATE": str(args.gemini_error_rate),
+        "STAGE_TIMING": "0",
+        "RESULT_CACHE_DIR": "",
+        "NEAR_DUPLICATE_INDEX_SIZE": "1024" if args.cache_hits else "0",
+    }
+    if args.max_queued_jobs is not None:
+        server_env["LUT_MAX_QUEUED_JOBS"] = str(args.max_queued_jobs)
+    path = f"/api/generate-lut?size={args.lut_size}"
+
+    print(f"{'workers':>7} {'conc':>5} {'ok':>5} {'503':>5} {'err':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>7}")
+    results = []
+    for workers in (int(value) for value in args.workers.split(",")):
+        server = start_server(args.port, workers, server_env)
+        try:
+            # Warm up the worker processes and reference caches outside the measurement; the
+            # first request alone, so with --cache-hits the repeated upload is cached before
+            # concurrent requests arrive
+            offset = max(concurrency_levels)
+            run_load(args.port, [multipart_request(bodies[0])], 1, path)
+            run_load(args.port, [multipart_request(body) for body in bodies[1:offset]], offset, path)
+            for concurrency in concurrency_levels:
+                batch = bodies[offset:offset + args.requests]
+                offset += args.requests
+                latencies, statuses, wall = run_load(
+                    args.port, [multipart_request(body) for body in batch], concurrency, path
+                )
+                row = {
+                    "workers": workers,
+                    "concurrency": concurrency,
+                    "ok": statuses.get(200, 0),
+                    "busy": statuses.get(503, 0),
+                    "errors": sum(count for status, count in statuses.items() if status not in (200, 503)),
+                    "p50": float(np.percentile(latencies, 50)) if latencies else None,
+                    "p95": float(np.percentile(latencies, 95)) if latencies else None,
+                    "p99": float(np.percentile(latencies, 99)) if latencies else None,
+                    "requests_per_second": statuses.get(200, 0) / wall
+                }
+                results.append(row)
+                latency_cells = " ".join(
+                    f"{row[key]:7.2f}s" if row[key] is not None else f"{'-':>8}" for key in ("p50", "p95", "p99")
+                )
+                print(
+                    f"{workers:>7} {concurrency:>5} {row['ok']:>5} {row['busy']:>5} {row['errors']:>5} "
+                    f"{latency_cells} {row['requests_per_second']:7.2f}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_load_test()
@@ -0,0 +1,73 @@
+"""Benchmark LUT generation latency and memory for each supported lattice size
+
+For every size in LUT_SIZES, times single-image generation (color transfer plus fitting the
+lattice to it), the lattice grading engine used for shoot LUTs, the reference-only adaptive
+LUT and .cube formatting, and reports their peak traced memory and the .cube file size.
+Run from the backend directory:
+
+    python -m benchmarks.lut_sizes
+"""
+import argparse
+import time
+import tracemalloc
+
+import main
+
+
+def measure(func, repeat: int) -> tuple:
+    """Best wall time over repeat runs, and the peak traced memory of one run, in MB"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(timings), peak / 2 ** 20
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, main.LUT_SIZES)))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    look_key = "orange_teal"
+    source_img = main.create_reference_image(main.CINEMATIC_LOOKS["bleach_bypass"], (384, 512), seed=0)
+    reference_img = main.get_reference_image(look_key, (256, 256))
+    source_analysis = main.analyze_image_characteristics(source_img)
+    reference_analysis = main.analyze_image_characteristics(reference_img)
+    reference_colors = main.analyze_reference_colors(reference_img)
+
+    print(f"{'size':>5} {'nodes':>9} {'transfer fit':>18} {'grading':>18} {'adaptive':>18} {'.cube':>18} {'file':>9}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        _, fit_time, fit_peak = measure(
+            lambda: main.generate_lut_from_color_transfer(
+                source_img, reference_img, "mkl", reference_colors, size
+            ),
+            args.repeat
+        )
+        lut, grading_time, grading_peak = measure(
+            lambda: main.apply_professional_color_grading_lattice(
+                main.create_identity_lattice(size), source_analysis, reference_analysis
+            ),
+            args.repeat
+        )
+        _, adaptive_time, adaptive_peak = measure(
+            lambda: main.create_adaptive_lut(reference_colors, size), args.repeat
+        )
+        cube, cube_time, cube_peak = measure(lambda: main.lut_to_cube(lut), args.repeat)
+        print(
+            f"{size:>5} {size ** 3:>9} "
+            f"{fit_time * 1000:7.1f}ms {fit_peak:6.1f}MB "
+            f"{grading_time * 1000:7.1f}ms {grading_peak:6.1f}MB "
+            f"{adaptive_time * 1000:7.1f}ms {adaptive_peak:6.1f}MB "
+            f"{cube_time * 1000:7.1f}ms {cube_peak:6.1f}MB "
+            f"{len(cube) / 2 ** 20:7.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,130 @@
+"""Benchmark each stage of the LUT pipeline and compare against a stored baseline
+
+Times create_reference_image per look, analyze_image_characteristics and
+generate_lut_from_color_transfer per image size, and create_adaptive_lut and lut_to_cube
+per lattice size, offline (no Gemini). Results are written to JSON; with a baseline, cases
+slower by more than --threshold (and --min-delta-ms) are flagged and the exit status is 1.
+Run from the backend directory:
+
+    python -m benchmarks.pipeline --output results.json
+    python -m benchmarks.pipeline --update-baseline
+
+The stored baseline is machine-specific: regenerate it on the machine that runs the check.
+"""
+import argparse
+import os
+import platform
+import sys
+
+import numpy as np
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+import main
+from benchmarks.tile_scaling import best_time, synthetic_image
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def pipeline_cases(image_sizes: list, lut_sizes: list, looks: list):
+    """Yield (case name, zero-argument function) for every benchmarked call"""
+    reference_img = main.get_reference_image("orange_teal", (256, 256))
+    reference_analysis = main.analyze_reference_colors(reference_img)
+
+    for width in image_sizes:
+        shape = (width * 3 // 4, width)
+        for look_key in looks:
+            yield (
+                f"create_reference_image[{look_key},{width}]",
+                lambda look=main.CINEMATIC_LOOKS[look_key], shape=shape: main.create_reference_image(look, shape, seed=0)
+            )
+        source_img = synthetic_image(*shape)
+        yield f"analyze_image_characteristics[{width}]", lambda img=source_img: main.analyze_image_characteristics(img)
+        for size in lut_sizes:
+            yield (
+                f"generate_lut_from_color_transfer[{width},{size}]",
+                lambda img=source_img, size=size: main.generate_lut_from_color_transfer(
+                    img, reference_img, "mkl", reference_analysis, size
+                )
+            )
+
+    for size in lut_sizes:
+        yield f"create_adaptive_lut[{size}]", lambda size=size: main.create_adaptive_lut(reference_analysis, size)
+        lut = main.create_adaptive_lut(reference_analysis, size)
+        yield f"lut_to_cube[{size}]", lambda lut=lut: main.lut_to_cube(lut)
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float) -> list:
+    """Return (case, baseline, current) for cases slower than the baseline by both margins"""
+    regressions = []
+    for case, seconds in results.items():
+        reference = baseline.get(case)
+        if reference is not None and seconds > reference * (1 + threshold) and seconds - reference > min_delta:
+            regressions.append((case, reference, seconds))
+    return regressions
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image-sizes", default="256,512,1024", help="Source image widths (4:3 aspect)")
+    parser.add_argument("--lut-sizes", default="17,33,65")
+    parser.add_argument("--looks", default=",".join(main.CINEMATIC_LOOKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    results = {}
+    for case, func in pipeline_cases(
+        [int(value) for value in args.image_sizes.split(",")],
+        [int(value) for value in args.lut_sizes.split(",")],
+        args.looks.split(",")
+    ):
+        results[case] = best_time(func, args.repeat)
+        print(f"{case:<50} {results[case] * 1000:9.2f}ms")
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "image_threads": main.IMAGE_THREADS,
+            "repeat": args.repeat
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms / 1000)
+    for case, reference, seconds in regressions:
+        print(f"REGRESSION {case}: {reference * 1000:.2f}ms -> {seconds * 1000:.2f}ms ({seconds / reference:.2f}x)")
+    missing = sorted(set(results) - set(baseline))
+    if missing:
+        print(f"{len(missing)} cases have no baseline: {', '.join(missing)}")
+    print(f"{len(regressions)} regressions over {args.threshold:.0%} in {len(results)} cases")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,83 @@
+"""Benchmark the row-band tile scheduler from 1 to N threads on a 24 MP image
+
+Times the per-pixel stages that run through TileScheduler (analysis statistics and LUT
+application) and prints the speedup over a single thread. --colors random grades uniformly
+random pixels instead of a photo-like image, the worst case for apply_lut's color table.
+Run from the backend directory:
+
+    python -m benchmarks.tile_scaling --threads 1,2,4,8
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+import main
+from lut_apply import apply_lut
+from lut_io import LutFile
+from tile_scheduler import TileScheduler
+
+
+def synthetic_image(height: int, width: int, seed: int = 0) -> np.ndarray:
+    """Smooth gradients plus noise, so the image has photo-like color counts"""
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, np.newaxis]
+    x = np.linspace(0, 1, width, dtype=np.float32)[np.newaxis, :]
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[:, :, 0] = 0.5 + 0.5 * np.sin(6 * x + 3 * y)
+    image[:, :, 1] = x * y
+    image[:, :, 2] = 0.5 + 0.4 * np.cos(9 * x * y)
+    image += rng.normal(0, 0.02, image.shape).astype(np.float32)
+    return np.clip(image, 0, 1)
+
+
+def best_time(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", default=",".join(str(2 ** i) for i in range(8) if 2 ** i <= (os.cpu_count() or 1)))
+    parser.add_argument("--tile-rows", type=int, default=main.IMAGE_TILE_ROWS)
+    parser.add_argument("--size", default="4000x6000", help="HEIGHTxWIDTH of the test image")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--colors", choices=("photo", "random"), default="photo")
+    args = parser.parse_args()
+
+    height, width = main.parse_size(args.size)
+    if args.colors == "random":
+        image = np.random.default_rng(0).random((height, width, 3), dtype=np.float32)
+    else:
+        image = synthetic_image(height, width)
+    image_uint8 = (image * 255).astype(np.uint8)
+    lut = LutFile(lut_3d=main.apply_cinematic_adjustments(
+        main.create_identity_lattice(main.LUT_SIZE), main.CINEMATIC_LOOKS["orange_teal"]
+    ).astype(np.float32))
+
+    stages = {
+        "analysis": lambda: main.analyze_image_characteristics(image),
+        "apply_lut": lambda: apply_lut(image_uint8, lut, scheduler=main.image_scheduler),
+    }
+
+    print(f"{height * width / 1e6:.1f} MP {args.colors}, tile rows {args.tile_rows}, {os.cpu_count()} CPUs")
+    print(f"{'threads':>8} " + " ".join(f"{name:>20}" for name in stages))
+    baseline = {}
+    for threads in (int(value) for value in args.threads.split(",")):
+        main.image_scheduler = TileScheduler(threads, args.tile_rows)
+        cells = []
+        for name, stage in stages.items():
+            seconds = best_time(stage, args.repeat)
+            baseline.setdefault(name, seconds)
+            cells.append(f"{seconds:8.3f}s ({baseline[name] / seconds:4.2f}x)")
+        main.image_scheduler.shutdown()
+        print(f"{threads:>8} " + " ".join(f"{cell:>20}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,332 @@
+import threading
+
+import numpy as np
+
+from lut_io import LutFile
+
+INTERPOLATIONS = ("trilinear", "tetrahedral")
+
+# 8-bit images at least this large are graded once per distinct color (a 2^24 entry table)
+# instead of once per pixel; photos have far fewer distinct colors than pixels
+COLOR_TABLE_MIN_PIXELS = 1 << 20
+
+# The color table (a 32-bit word of RGB per color) and the bitmap of colors present take 5
+# bytes per color. They count against the memory budget, and are only used when the budget
+# leaves at least COLOR_TABLE_MIN_BAND_BUDGET for the row bands on top of them.
+COLOR_TABLE_BYTES = 5 << 24
+COLOR_TABLE_MIN_BAND_BUDGET = 16 << 20
+
+# Default cap on the scratch memory used while applying a LUT, whatever the image size; room
+# for the color table and 48 MB of row bands
+DEFAULT_MEMORY_BUDGET = 128 << 20
+
+
+class BandScratch:
+    """Work buffers for one row band, allocated once and reused for every band of an image
+
+    Interpolation runs in these buffers through ufunc out= arguments, so bands allocate no
+    float intermediates and peak memory stays at pixels * bytes_per_pixel() on top of the
+    image and the output.
+    """
+
+    def __init__(self, pixels: int):
+        self.pixels = pixels
+        self.index = np.empty((3, pixels), dtype=np.int32)
+        self.fraction = np.empty((3, pixels), dtype=np.float32)
+        self.base = np.empty(pixels, dtype=np.int32)
+        self.corner = np.empty(pixels, dtype=np.int32)
+        self.weights = np.empty((4, pixels), dtype=np.float32)
+        self.masks = np.empty((2, pixels), dtype=bool)
+        self.values = np.empty((4, pixels, 3), dtype=np.float32)
+        # Color-table path: packed 24-bit colors and their graded 8-bit RGB, padded to words
+        self.colors = np.empty(pixels, dtype="<u4")
+        self.graded = np.zeros((pixels, 4), dtype=np.uint8)
+
+    @classmethod
+    def bytes_per_pixel(cls) -> int:
+        return sum(buffer.nbytes for buffer in vars(cls(1)).values() if isinstance(buffer, np.ndarray))
+
+
+def band_rows(width: int, height: int, memory_budget: int) -> int:
+    """Number of image rows per band that keeps the scratch buffers within memory_budget"""
+    return max(1, min(height, memory_budget // (width * BandScratch.bytes_per_pixel())))
+
+
+def input_tables(lut: LutFile, levels: int) -> tuple:
+    """Lattice cell index and offset for every input code of every channel
+
+    Integer inputs only take `levels` values, so the domain mapping and 1D shaper are evaluated
+    once per code. Returns (index, fraction), both (3, levels).
+    """
+    size = lut.lut_3d.shape[0]
+    values = np.arange(levels, dtype=np.float64) / (levels - 1)
+    index = np.empty((3, levels), dtype=np.int32)
+    fraction = np.empty((3, levels), dtype=np.float32)
+    for channel in range(3):
+        position = apply_domain(values, lut, channel)
+        if lut.lut_1d is not None:
+            # A 1D shaper maps the domain onto the 3D table's [0, 1] input
+            position = apply_curve(position, lut.lut_1d[:, channel])
+        position = np.clip(position, 0, 1) * (size - 1)
+        index[channel] = np.minimum(position.astype(np.int32), size - 2)
+        fraction[channel] = position - index[channel]
+    return index, fraction
+
+
+def apply_domain(values: np.ndarray, lut: LutFile, channel: int) -> np.ndarray:
+    """Normalize input values by the LUT's DOMAIN_MIN/MAX for one channel"""
+    low = float(lut.domain_min[channel])
+    high = float(lut.domain_max[channel])
+    return (values - low) / (high - low)
+
+
+def apply_curve(values: np.ndarray, curve: np.ndarray) -> np.ndarray:
+    """Linearly interpolate a 1D curve sampled uniformly over [0, 1]"""
+    return np.interp(np.clip(values, 0, 1), np.linspace(0, 1, len(curve)), curve)
+
+
+def lerp_into(low: np.ndarray, high: np.ndarray, fraction: np.ndarray):
+    """low += (high - low) * fraction, in place (high is overwritten)"""
+    high -= low
+    high *= fraction
+    low += high
+
+
+def interpolate_trilinear(table: np.ndarray, size: int, fraction: np.ndarray, scratch: BandScratch, count: int) -> np.ndarray:
+    """Trilinear interpolation at the cells in scratch.base, returning a (count, 3) scratch view"""
+    base = scratch.base[:count]
+    corner = scratch.corner[:count]
+    result, plane, line, high = scratch.values[:, :count]
+    fr, fg, fb = (f[:, np.newaxis] for f in fraction)
+
+    # Interpolate along blue, then green, then red
+    for dr in (0, 1):
+        target = result if dr == 0 else plane
+        for dg in (0, 1):
+            low = target if dg == 0 else line
+            np.add(base, (dr * size + dg) * size, out=corner)
+            np.take(table, corner, axis=0, out=low, mode="clip")
+            corner += 1
+            np.take(table, corner, axis=0, out=high, mode="clip")
+            lerp_into(low, high, fb)
+        lerp_into(target, line, fg)
+    lerp_into(result, plane, fr)
+    return result
+
+
+def interpolate_tetrahedral(table: np.ndarray, size: int, fraction: np.ndarray, scratch: BandScratch, count: int) -> np.ndarray:
+    """Tetrahedral interpolation at the cells in scratch.base, returning a (count, 3) scratch view
+
+    Each cube cell is split into six tetrahedra along its black-white diagonal; the one holding
+    a point is picked by the order of its red, green and blue offsets.
+    """
+    fr, fg, fb = fraction
+    strides = (size * size, size, 1)
+    diagonal = sum(strides)
+    base = scratch.base[:count]
+    corner = scratch.corner[:count]
+    f_max, f_mid, f_min, weight = scratch.weights[:, :count]
+    red_axis, green_axis = scratch.masks[:, :count]
+    result, gathered = scratch.values[:2, :count]
+
+    np.maximum(fr, fg, out=f_max)
+    np.maximum(f_max, fb, out=f_max)
+    np.minimum(fr, fg, out=f_min)
+    np.minimum(f_min, fb, out=f_min)
+    np.add(fr, fg, out=f_mid)
+    f_mid += fb
+    f_mid -= f_max
+    f_mid -= f_min
+
+    np.take(table, base, axis=0, out=result, mode="clip")
+    np.subtract(1, f_max, out=weight)
+    result *= weight[:, np.newaxis]
+
+    # Walk from the black corner along the axis with the largest offset, then the middle one.
+    # For booleans a > b is a & ~b, which keeps the masks in scratch.
+    np.greater_equal(fr, fg, out=red_axis)
+    np.greater_equal(fr, fb, out=green_axis)
+    red_axis &= green_axis
+    np.greater_equal(fg, fb, out=green_axis)
+    np.greater(green_axis, red_axis, out=green_axis)
+    np.add(base, strides[2], out=corner)
+    np.add(corner, strides[0] - strides[2], out=corner, where=red_axis)
+    np.add(corner, strides[1] - strides[2], out=corner, where=green_axis)
+    np.take(table, corner, axis=0, out=gathered, mode="clip")
+    np.subtract(f_max, f_mid, out=weight)
+    gathered *= weight[:, np.newaxis]
+    result += gathered
+
+    np.less(fr, fg, out=red_axis)
+    np.less(fr, fb, out=green_axis)
+    red_axis &= green_axis
+    np.less(fg, fb, out=green_axis)
+    np.greater(green_axis, red_axis, out=green_axis)
+    np.add(base, diagonal - strides[2], out=corner)
+    np.subtract(corner, strides[0] - strides[2], out=corner, where=red_axis)
+    np.subtract(corner, strides[1] - strides[2], out=corner, where=green_axis)
+    np.take(table, corner, axis=0, out=gathered, mode="clip")
+    np.subtract(f_mid, f_min, out=weight)
+    gathered *= weight[:, np.newaxis]
+    result += gathered
+
+    np.add(base, diagonal, out=corner)
+    np.take(table, corner, axis=0, out=gathered, mode="clip")
+    gathered *= f_min[:, np.newaxis]
+    result += gathered
+    return result
+
+
+def grade_codes(codes: np.ndarray, lut: LutFile, tables: tuple, interpolation: str, scratch: BandScratch, out: np.ndarray):
+    """Grade (P, 3) integer input codes through the LUT into out, an integer (P, 3) array"""
+    count = len(codes)
+    size = lut.lut_3d.shape[0]
+    index_table, fraction_table = tables
+    index = scratch.index[:, :count]
+    fraction = scratch.fraction[:, :count]
+    for channel in range(3):
+        np.take(index_table[channel], codes[:, channel], out=index[channel], mode="clip")
+        np.take(fraction_table[channel], codes[:, channel], out=fraction[channel], mode="clip")
+
+    base = scratch.base[:count]
+    np.multiply(index[0], size, out=base)
+    base += index[1]
+    base *= size
+    base += index[2]
+
+    interpolate = interpolate_tetrahedral if interpolation == "tetrahedral" else interpolate_trilinear
+    graded = interpolate(lut.lut_3d.reshape(-1, 3), size, fraction, scratch, count)
+
+    # Round to the output dtype in place
+    max_value = np.iinfo(out.dtype).max
+    graded *= max_value
+    graded += 0.5
+    np.clip(graded, 0, max_value, out=graded)
+    np.copyto(out, graded, casting="unsafe")
+
+
+def to_integer(values: np.ndarray, dtype) -> np.ndarray:
+    """Round normalized values to an integer image dtype"""
+    max_value = np.iinfo(dtype).max
+    values = values * max_value + 0.5
+    np.clip(values, 0, max_value, out=values)
+    return values.astype(dtype)
+
+
+def apply_curves_only(image: np.ndarray, lut: LutFile, out: np.ndarray) -> np.ndarray:
+    """Apply a 1D-only LUT through per-channel lookup tables"""
+    levels = np.iinfo(image.dtype).max + 1
+    values = np.arange(levels, dtype=np.float64) / (levels - 1)
+    for channel in range(3):
+        curve = apply_curve(apply_domain(values, lut, channel), lut.lut_1d[:, channel])
+        out[:, :, channel] = to_integer(curve, image.dtype)[image[:, :, channel]]
+    return out
+
+
+def map_bands(func, height: int, rows: int, scheduler=None) -> list:
+    """Call func(band) for consecutive row bands, on a TileScheduler's threads if one is given"""
+    if scheduler is not None:
+        return scheduler.map(func, height, rows)
+    return [func(slice(start, min(start + rows, height))) for start in range(0, height, rows)]
+
+
+def apply_lut(
+    image: np.ndarray,
+    lut: LutFile,
+    interpolation: str = "tetrahedral",
+    out: np.ndarray = None,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    scheduler=None
+) -> np.ndarray:
+    """Apply a LUT to an 8- or 16-bit (height, width, 3) RGB image, returning the same dtype
+
+    Works through row bands sized so the reused scratch buffers fit memory_budget bytes, and
+    writes each band straight into out (a new array by default). out may be the image itself
+    to grade in place, or a np.memmap for images too large to hold twice. With a scheduler
+    (tile_scheduler.TileScheduler) bands are graded on its threads, each with its own scratch
+    buffers and an equal share of the budget. Large 8-bit images take the color-table path
+    only when the budget covers COLOR_TABLE_BYTES as well, and the bands get the rest.
+    """
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError(f"Unknown interpolation '{interpolation}', expected one of {', '.join(INTERPOLATIONS)}")
+    if image.ndim != 3 or image.shape[2] != 3 or image.dtype not in (np.uint8, np.uint16):
+        raise ValueError("Expected an 8- or 16-bit RGB image")
+    if out is None:
+        out = np.empty_like(image, order="C")
+    elif out.shape != image.shape or out.dtype != image.dtype or not out.flags.c_contiguous:
+        raise ValueError("out must be a C-contiguous array with the image's shape and dtype")
+    if lut.lut_3d is None:
+        return apply_curves_only(image, lut, out)
+
+    tables = input_tables(lut, np.iinfo(image.dtype).max + 1)
+    height, width = image.shape[:2]
+    threads = scheduler.threads if scheduler is not None else 1
+    use_color_table = (
+        image.dtype == np.uint8
+        and height * width >= COLOR_TABLE_MIN_PIXELS
+        and memory_budget - COLOR_TABLE_BYTES >= COLOR_TABLE_MIN_BAND_BUDGET
+    )
+    if use_color_table:
+        memory_budget -= COLOR_TABLE_BYTES
+    rows = band_rows(width, height, memory_budget // threads)
+    local = threading.local()
+
+    def get_scratch() -> BandScratch:
+        if not hasattr(local, "scratch"):
+            local.scratch = BandScratch(rows * width)
+        return local.scratch
+
+    if use_color_table:
+        # Mark the colors present, grade each once, then gather per pixel. The byte-per-color
+        # bitmap is small enough to stay mostly in cache while marking; graded colors are RGB
+        # padded to a 32-bit word, so storing and gathering move one word per color.
+        present = np.zeros(1 << 24, dtype=bool)
+        words = np.empty(1 << 24, dtype="<u4")
+
+        def mark_band(band: slice):
+            # Concurrent bands only ever store True, so they need no locking
+            pixels = image[band]
+            present[pack_rgb(pixels, get_scratch().base[:pixels.shape[0] * width])] = True
+
+        def grade_colors(chunk: slice):
+            scratch = get_scratch()
+            found = np.flatnonzero(present[chunk])
+            colors = scratch.colors[:len(found)]
+            np.add(found, chunk.start, out=colors, casting="unsafe")
+            # Little-endian 0x00RRGGBB words are B, G, R, 0 in memory
+            codes = colors.view(np.uint8).reshape(-1, 4)[:, 2::-1]
+            graded = scratch.graded[:len(found)]
+            grade_codes(codes, lut, tables, interpolation, scratch, graded[:, :3])
+            words[colors] = graded.view("<u4").ravel()
+
+        def gather_band(band: slice):
+            scratch = get_scratch()
+            pixels = image[band]
+            count = pixels.shape[0] * width
+            packed = pack_rgb(pixels, scratch.base[:count])
+            gathered = scratch.corner[:count].view("<u4")
+            np.take(words, packed, out=gathered, mode="clip")
+            np.copyto(out[band].reshape(-1, 3), gathered.view(np.uint8).reshape(-1, 4)[:, :3])
+
+        map_bands(mark_band, height, rows, scheduler)
+        map_bands(grade_colors, 1 << 24, rows * width, scheduler)
+        map_bands(gather_band, height, rows, scheduler)
+        return out
+
+    def grade_band(band: slice):
+        grade_codes(image[band].reshape(-1, 3), lut, tables, interpolation, get_scratch(), out[band].reshape(-1, 3))
+
+    map_bands(grade_band, height, rows, scheduler)
+    return out
+
+
+def pack_rgb(image: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """Pack 8-bit RGB pixels into flat 24-bit color codes"""
+    pixels = image.reshape(-1, 3)
+    if out is None:
+        out = np.empty(len(pixels), dtype=np.int32)
+    np.copyto(out, pixels[:, 0])
+    for channel in (1, 2):
+        out <<= 8
+        out |= pixels[:, channel]
+    return out
@@ -0,0 +1,194 @@
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+# Bytes per value in the fixed "d.dddddd d.dddddd d.dddddd\n" layout written by lut_to_cube:
+# one digit, the point, six decimals and a separator (space, or newline after blue)
+FIXED_VALUE_BYTES = 9
+
+
+def parse_fixed_rows(data: bytes):
+    """Decode rows in lut_to_cube's fixed-width layout straight from the bytes
+
+    Returns an (M, 3) float32 array, or None if the data is not in that layout.
+    """
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    if len(data) % (3 * FIXED_VALUE_BYTES):
+        return None
+
+    chars = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3, FIXED_VALUE_BYTES)
+    if not (
+        np.all(chars[:, :, 1] == ord("."))
+        and np.all(chars[:, :2, 8] == ord(" "))
+        and np.all(chars[:, 2, 8] == ord("\n"))
+    ):
+        return None
+
+    # Characters below '0' wrap around to large values, so one comparison checks both bounds
+    digits = chars - np.uint8(ord("0"))
+    if np.any(digits[:, :, 0] > 9) or np.any(digits[:, :, 2:8] > 9):
+        return None
+
+    # Integer millionths per value, then a single division like a decimal parse would do
+    micros = digits[:, :, 0].astype(np.int32)
+    for column in range(2, 8):
+        micros = micros * 10 + digits[:, :, column]
+    return (micros / 1e6).astype(np.float32)
+
+
+@dataclass
+class LutFile:
+    """A parsed LUT file: an optional 1D shaper and/or 3D table plus its metadata
+
+    lut_3d is (size, size, size, 3) indexed as [r, g, b]; lut_1d is (size, 3). Values are kept
+    as stored; the domain gives the input range the tables are sampled over.
+    """
+    lut_3d: Optional[np.ndarray] = None
+    lut_1d: Optional[np.ndarray] = None
+    title: Optional[str] = None
+    domain_min: np.ndarray = field(default_factory=lambda: np.zeros(3, dtype=np.float32))
+    domain_max: np.ndarray = field(default_factory=lambda: np.ones(3, dtype=np.float32))
+
+
+def split_header(content: str, is_data_line) -> tuple:
+    """Return (header_lines, data_start) walking the header without splitting the data section"""
+    header = []
+    offset = 0
+    while offset < len(content):
+        line_end = content.find("\n", offset)
+        if line_end == -1:
+            line_end = len(content)
+        stripped = content[offset:line_end].strip()
+        if stripped and not stripped.startswith("#"):
+            if is_data_line(stripped):
+                return header, offset
+            header.append(stripped)
+        offset = line_end + 1
+    return header, None
+
+
+def parse_numbers(data: str, dtype=np.float32) -> np.ndarray:
+    """Tokenize whitespace-separated numbers in a single pass, skipping comment lines
+
+    Raises ValueError on tokens that are not numbers.
+    """
+    if "#" in data:
+        data = "\n".join(line for line in data.splitlines() if not line.lstrip().startswith("#"))
+    return np.fromstring(data, dtype=dtype, sep=" ")
+
+
+def is_cube_data_line(stripped: str) -> bool:
+    return stripped[0].isdigit() or stripped[0] in "-+."
+
+
+def parse_domain(keyword: str, value: str) -> np.ndarray:
+    """Parse a DOMAIN_MIN/DOMAIN_MAX value: exactly one number per channel"""
+    domain = np.array(value.split(), dtype=np.float32)
+    if domain.shape != (3,):
+        raise ValueError(f"{keyword} needs 3 values, got {domain.size}")
+    return domain
+
+
+def read_cube(content: str) -> LutFile:
+    """Parse a .cube file (1D, 3D or a 1D shaper followed by a 3D table)"""
+    lut = LutFile()
+    size_1d = None
+    size_3d = None
+
+    header, data_start = split_header(content, is_cube_data_line)
+    for line in header:
+        keyword, _, value = line.partition(" ")
+        value = value.strip()
+        if keyword == "TITLE":
+            lut.title = value.strip('"')
+        elif keyword == "LUT_1D_SIZE":
+            size_1d = int(value)
+        elif keyword == "LUT_3D_SIZE":
+            size_3d = int(value)
+        elif keyword == "DOMAIN_MIN":
+            lut.domain_min = parse_domain(keyword, value)
+        elif keyword == "DOMAIN_MAX":
+            lut.domain_max = parse_domain(keyword, value)
+        elif keyword in ("LUT_1D_INPUT_RANGE", "LUT_3D_INPUT_RANGE"):
+            low, high = (float(x) for x in value.split())
+            lut.domain_min = np.full(3, low, dtype=np.float32)
+            lut.domain_max = np.full(3, high, dtype=np.float32)
+
+    if size_1d is None and size_3d is None:
+        raise ValueError("Missing LUT_1D_SIZE or LUT_3D_SIZE in .cube file")
+    for keyword, size in (("LUT_1D_SIZE", size_1d), ("LUT_3D_SIZE", size_3d)):
+        if size is not None and size < 2:
+            raise ValueError(f"{keyword} must be at least 2, got {size}")
+    if data_start is None:
+        raise ValueError("No LUT data found in .cube file")
+
+    data = content[data_start:]
+    values = parse_fixed_rows(data.encode("ascii", errors="replace"))
+    if values is None:
+        values = parse_numbers(data)
+        if values.size % 3:
+            raise ValueError("LUT data is not a whole number of RGB entries")
+        values = values.reshape(-1, 3)
+
+    entries_1d = size_1d or 0
+    entries_3d = size_3d ** 3 if size_3d else 0
+    if len(values) != entries_1d + entries_3d:
+        raise ValueError(f"Expected {entries_1d + entries_3d} LUT entries, found {len(values)}")
+
+    # A 1D shaper comes first; .cube 3D data is Blue-fastest (for R, for G, for B),
+    # i.e. C order for [r, g, b]
+    if size_1d:
+        lut.lut_1d = values[:entries_1d]
+    if size_3d:
+        lut.lut_3d = values[entries_1d:].reshape(size_3d, size_3d, size_3d, 3)
+    return lut
+
+
+def read_3dl(content: str) -> LutFile:
+    """Parse a .3dl file (Autodesk/Lustre) into a LutFile with a normalized 3D table
+
+    The first line of numbers lists the input sample positions and sets the lattice size;
+    integer output values are scaled by the output bit depth ("Mesh" header or inferred).
+    """
+    def is_shaper_line(stripped: str) -> bool:
+        return stripped[0].isdigit() and len(stripped.split()) > 3
+
+    header, data_start = split_header(content, is_shaper_line)
+    if data_start is None:
+        raise ValueError("No input sample line found in .3dl file")
+
+    output_bits = None
+    for line in header:
+        parts = line.split()
+        if parts[0].lower() == "mesh" and len(parts) == 3:
+            output_bits = int(parts[2])
+
+    shaper_end = content.find("\n", data_start)
+    shaper_end = len(content) if shaper_end == -1 else shaper_end
+    size = len(content[data_start:shaper_end].split())
+    values = parse_numbers(content[shaper_end:], dtype=np.float64)
+    if values.size != size ** 3 * 3:
+        raise ValueError(f"Expected {size ** 3} LUT entries for a {size}-point .3dl, found {values.size / 3:g}")
+
+    if output_bits is None:
+        # Smallest common integer depth that holds every value
+        max_value = values.max(initial=0)
+        output_bits = next((bits for bits in (10, 12, 14, 16) if max_value <= 2 ** bits - 1), 16)
+
+    # .3dl is Blue-fastest like .cube
+    lut_3d = (values / (2 ** output_bits - 1)).astype(np.float32)
+    return LutFile(lut_3d=lut_3d.reshape(size, size, size, 3))
+
+
+def read_lut(content: str, filename: str = "") -> LutFile:
+    """Parse a .cube, .3dl or .lut file, choosing the format by extension or by content"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".3dl":
+        return read_3dl(content)
+    if extension == ".cube" or "LUT_3D_SIZE" in content[:4096] or "LUT_1D_SIZE" in content[:4096]:
+        return read_cube(content)
+    return read_3dl(content)
+
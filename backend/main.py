@@ -1,19 +1,38 @@
 import os
+import time
+import asyncio
+import logging
+import multiprocessing
 import numpy as np
 import cv2
 import google.generativeai as genai
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, TypedDict
 from PIL import Image
 import io
+import hashlib
+import zipfile
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from color_matcher import ColorMatcher
+from color_matcher.top_level import METHODS as COLOR_MATCHER_METHODS
 from color_matcher.io_handler import load_img_file
 from color_matcher.normalizer import Normalizer
 from skimage import img_as_float, img_as_ubyte
 import base64
+from result_cache import ResultCache
+from perceptual_index import PerceptualIndex, image_fingerprint
+from lut_io import LutFile, read_cube, read_lut
+from lut_apply import INTERPOLATIONS, apply_lut
+from tile_scheduler import TileScheduler, sum_partials
+from stage_timing import StageTimingMiddleware, current_timings, run_timed, span
+from prometheus import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE, Counter, Gauge, Histogram, Registry
 
 try:
     import ujson as json
@@ -26,10 +45,26 @@ load_dotenv()
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up caches and start the LUT worker pool on startup"""
+    global lut_executor
+    warm_caches()
+    if LUT_WORKERS > 0:
+        lut_executor = start_lut_executor()
+    yield
+    image_scheduler.shutdown()
+    analysis_cache.flush()
+    lut_cache.flush()
+    if lut_executor is not None:
+        lut_executor.shutdown(cancel_futures=True)
+        lut_executor = None
+
 app = FastAPI(
     title="LUTForge AI API",
     description="AI-powered 3D LUT generation with professional color matching",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Get allowed origins from environment variable or use defaults
@@ -47,6 +82,185 @@ app.add_middleware(
 # Constants
 LUT_SIZE = 33
 
+# Lattice sizes a request may ask for: 17 for fast previews, 33 by default, 65/129 for finishing
+LUT_SIZES = (17, 33, 65, 129)
+
+# Fitting a LUT to a color transfer: [1, 2, 1] smoothing passes over the scattered pixel pairs,
+# and the prior weight (relative to the mean weight of occupied nodes) that pulls nodes far
+# from any pixel back toward identity
+LUT_FIT_SMOOTHING_PASSES = 1
+LUT_FIT_PRIOR_WEIGHT = 0.01
+
+# Gemini analysis runs on the SDK's async API; cap concurrent calls and bound their duration
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+# CPU-bound LUT generation runs in a process pool sized to the cores (0 runs it in a thread
+# instead). Jobs beyond the workers plus LUT_MAX_QUEUED_JOBS are rejected with a 503.
+LUT_WORKERS = int(os.getenv("LUT_WORKERS", str(os.cpu_count() or 1)))
+LUT_MAX_QUEUED_JOBS = int(os.getenv("LUT_MAX_QUEUED_JOBS", str(2 * max(LUT_WORKERS, 1))))
+lut_executor = None
+lut_jobs_in_flight = 0
+
+# Times a LUT was built by the create_adaptive_lut fallback instead of the color transfer or
+# the grading engine; shared memory, so the LUT workers' hits are counted too
+lut_fallback_count = multiprocessing.get_context("spawn").Value("q", 0)
+# Times Gemini analysis failed and the warm_vintage fallback was returned
+analysis_fallback_count = 0
+
+# Per-pixel image stages (analysis statistics, LUT application) run in row bands of
+# IMAGE_TILE_ROWS on IMAGE_THREADS threads per process; the default splits the cores
+# between the LUT workers
+IMAGE_THREADS = int(os.getenv("IMAGE_THREADS", str(max(1, (os.cpu_count() or 1) // max(LUT_WORKERS, 1)))))
+IMAGE_TILE_ROWS = int(os.getenv("IMAGE_TILE_ROWS", "256"))
+image_scheduler = TileScheduler(IMAGE_THREADS, IMAGE_TILE_ROWS)
+
+# Duplicate uploads are served from a content-addressed cache (SHA-256 of the bytes) holding
+# the Gemini analysis and the generated .cube; RESULT_CACHE_DIR adds a shared on-disk backend,
+# read with get_async and written by a background thread so file I/O stays off the event loop
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or None
+analysis_cache = ResultCache(
+    "analysis", int(os.getenv("ANALYSIS_CACHE_SIZE", "1024")), RESULT_CACHE_TTL, RESULT_CACHE_DIR
+)
+lut_cache = ResultCache(
+    "lut", int(os.getenv("LUT_CACHE_SIZE", "64")), RESULT_CACHE_TTL, RESULT_CACHE_DIR
+)
+
+# Re-encoded or resized copies of a recent upload reuse its Gemini look decision, matched by a
+# perceptual fingerprint (DCT hash + coarse color histogram) of a small thumbnail
+NEAR_DUPLICATE_INDEX_SIZE = int(os.getenv("NEAR_DUPLICATE_INDEX_SIZE", "1024"))
+near_duplicate_index = PerceptualIndex(
+    max_entries=NEAR_DUPLICATE_INDEX_SIZE,
+    max_distance=int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "6")),
+    max_histogram_distance=float(os.getenv("NEAR_DUPLICATE_MAX_HISTOGRAM_DISTANCE", "0.2")),
+    ttl=RESULT_CACHE_TTL
+) if NEAR_DUPLICATE_INDEX_SIZE > 0 else None
+
+# Prometheus metrics for /metrics, rendered in the text exposition format without a client
+# library. Numbers other components already keep are read at scrape time.
+metrics_registry = Registry()
+http_requests = metrics_registry.register(Counter(
+    "lutforge_http_requests_total", "HTTP requests handled", ("method", "route", "status")
+))
+http_request_duration = metrics_registry.register(Histogram(
+    "lutforge_http_request_duration_seconds", "HTTP request latency, including streamed bodies", ("route",)
+))
+http_requests_in_flight = metrics_registry.register(Gauge(
+    "lutforge_http_requests_in_flight", "HTTP requests being handled"
+))
+stage_duration = metrics_registry.register(Histogram(
+    "lutforge_stage_duration_seconds", "Time per pipeline stage within a request", ("stage",)
+))
+gemini_request_duration = metrics_registry.register(Histogram(
+    "lutforge_gemini_request_duration_seconds", "Gemini analysis call latency by outcome", ("outcome",)
+))
+metrics_registry.register(Counter(
+    "lutforge_analysis_fallbacks_total", "Analyses that fell back to the warm_vintage look",
+    function=lambda: {(): analysis_fallback_count}
+))
+metrics_registry.register(Counter(
+    "lutforge_lut_fallbacks_total", "LUTs built by the adaptive fallback instead of the transfer or grading engine",
+    function=lambda: {(): lut_fallback_count.value}
+))
+metrics_registry.register(Gauge(
+    "lutforge_lut_jobs_in_flight", "LUT jobs running or queued on the worker pool",
+    function=lambda: {(): lut_jobs_in_flight}
+))
+
+def cache_stats() -> dict:
+    caches = {"analysis": analysis_cache.stats(), "lut": lut_cache.stats()}
+    if near_duplicate_index is not None:
+        caches["near_duplicate"] = near_duplicate_index.stats()
+    return caches
+
+for stat, metric_type, documentation in (
+    ("hits", Counter, "Cache lookups that found an entry"),
+    ("misses", Counter, "Cache lookups that found nothing"),
+    ("entries", Gauge, "Live cache entries"),
+    ("hit_ratio", Gauge, "Fraction of cache lookups that hit"),
+):
+    metrics_registry.register(metric_type(
+        f"lutforge_cache_{stat}" + ("_total" if metric_type is Counter else ""), documentation, ("cache",),
+        function=lambda stat=stat: {(name,): stats[stat] for name, stats in cache_stats().items()}
+    ))
+
+def record_request_start(scope):
+    http_requests_in_flight.inc()
+
+def record_request(scope, status, total: float, durations: dict):
+    """Count a finished request and observe its latency and stage timings"""
+    http_requests_in_flight.dec()
+    # Route templates, not raw paths, so label cardinality stays bounded
+    route = getattr(scope.get("route"), "path", "unmatched")
+    http_requests.inc(method=scope["method"], route=route, status=status or 500)
+    http_request_duration.observe(total, route=route)
+    if STAGE_METRICS:
+        for stage, seconds in durations.items():
+            stage_duration.observe(seconds, stage=stage)
+
+# Per-request stage timings (decode, gemini, reference, transfer, lut_fit, cube, ...) feed the
+# stage histogram with STAGE_METRICS and, with STAGE_TIMING, go out as a Server-Timing header
+# and a JSON log line on the lutforge.timing logger. With neither, stages are not timed at all;
+# request counts and latencies are always recorded.
+STAGE_TIMING = os.getenv("STAGE_TIMING", "1") == "1"
+STAGE_METRICS = os.getenv("STAGE_METRICS", "1") == "1"
+timing_logger = None
+if STAGE_TIMING:
+    timing_logger = logging.getLogger("lutforge.timing")
+    if not timing_logger.handlers:
+        timing_logger.addHandler(logging.StreamHandler())
+        timing_logger.setLevel(logging.INFO)
+app.add_middleware(
+    StageTimingMiddleware,
+    server_timing=STAGE_TIMING,
+    logger=timing_logger,
+    on_start=record_request_start,
+    on_complete=record_request,
+    stages=STAGE_TIMING or STAGE_METRICS
+)
+
+# Progressive generation first sends a coarse LUT built from a small draft-decoded thumbnail,
+# graded to the cached look for the upload or PREVIEW_LOOK while Gemini is still running
+PREVIEW_LUT_SIZE = 17
+PREVIEW_MAX_SIZE = 64
+PREVIEW_LOOK = "warm_vintage"
+
+# Maximum number of images accepted by /api/generate-luts in one request
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+
+# Graded previews from /api/apply-lut: PIL format, media type and encoder options
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 95}),
+    "png": ("PNG", "image/png", {"compress_level": 1}),
+    "tiff": ("TIFF", "image/tiff", {}),
+}
+
+# Scratch memory (MB) for applying a LUT, worked through in row bands of that size so very
+# large images (e.g. 100 MP deliverables) grade without full-size float intermediates
+LUT_APPLY_MEMORY_BUDGET = int(os.getenv("LUT_APPLY_MEMORY_BUDGET", "128")) << 20
+
+# Reference images are a pure function of (look, size, seed), so they are memoized
+REFERENCE_SEED = int(os.getenv("REFERENCE_SEED", "42"))
+REFERENCE_CACHE_SIZE = int(os.getenv("REFERENCE_CACHE_SIZE", "16"))
+
+def parse_size(value: str) -> tuple:
+    """Parse a "HEIGHTxWIDTH" string into a (height, width) tuple"""
+    return tuple(int(dim) for dim in value.lower().split("x"))
+
+# Reference statistics are computed once per look at this canonical resolution, so
+# per-request work does not scale with the upload. "source" synthesizes at the thumbnail size.
+REFERENCE_SIZE = os.getenv("REFERENCE_SIZE", "256x256").strip().lower()
+REFERENCE_CANONICAL_SIZE = None if REFERENCE_SIZE == "source" else parse_size(REFERENCE_SIZE)
+
+# Optional startup warm-up for "source" mode, e.g. "512x512,384x512,512x384" (thumbnail sizes)
+REFERENCE_WARMUP_SIZES = [
+    parse_size(size)
+    for size in os.getenv("REFERENCE_WARMUP_SIZES", "").split(",")
+    if size.strip()
+]
+
 class CinematicLook(BaseModel):
     name: str
     description: str
@@ -61,6 +275,30 @@ class ColorMatcherResponse(BaseModel):
     method: str
     confidence: float
 
+class ToneAnalysis(TypedDict):
+    rgb_avg: np.ndarray
+    saturation_avg: float
+    luminance_avg: float
+
+class OverallAnalysis(TypedDict):
+    rgb_avg: np.ndarray
+    temperature: float
+    tint: float
+    contrast: float
+    saturation_avg: float
+
+class ColorAnalysis(TypedDict):
+    """Color statistics of an image, as produced by analyze_image_characteristics (sources)
+    and analyze_reference_colors (references) and read by every LUT builder"""
+    shadows: ToneAnalysis
+    midtones: ToneAnalysis
+    highlights: ToneAnalysis
+    overall: OverallAnalysis
+    temperature_bias: str  # 'warm' or 'cool'
+    warmth_strength: float
+    color_cast: str  # 'red', 'green' or 'blue'
+    cast_strength: float
+
 # Reference cinematic looks with their characteristic color points
 CINEMATIC_LOOKS = {
     "orange_teal": CinematicLook(
@@ -150,118 +388,99 @@ CINEMATIC_LOOKS = {
     )
 }
 
-def create_reference_image(look: CinematicLook, size: tuple = (256, 256)) -> np.ndarray:
+# Reference image patterns, keyed by CinematicLook.name. Each generator receives the
+# normalized pixel coordinates pos_x (1, width) and pos_y (height, 1) and returns the
+# R, G, B planes as arrays that broadcast to (height, width).
+REFERENCE_PATTERNS: Dict[str, Callable[[np.ndarray, np.ndarray], tuple]] = {}
+
+def reference_pattern(look_name: str):
+    """Register a coordinate-grid reference pattern generator for a cinematic look"""
+    def register(generator: Callable[[np.ndarray, np.ndarray], tuple]):
+        REFERENCE_PATTERNS[look_name] = generator
+        return generator
+    return register
+
+@reference_pattern("Orange & Teal")
+def orange_teal_pattern(pos_x: np.ndarray, pos_y: np.ndarray) -> tuple:
+    """Realistic sunset/urban scene: cool sky, warm transition, warm ground/subject"""
+    sky = pos_y < 0.4
+    mid = ~sky & (pos_y < 0.7)
+    warmth = pos_x * 0.6 + 0.2
+    return (
+        np.where(sky, 0.15 + pos_x * 0.1, np.where(mid, warmth, 0.85 + pos_x * 0.1)),
+        np.where(sky, 0.35 + pos_x * 0.15, np.where(mid, warmth * 0.7, 0.55 + pos_x * 0.1)),
+        np.where(sky, 0.55 + pos_x * 0.2, np.where(mid, warmth * 0.4, 0.25 + pos_x * 0.05)),
+    )
+
+@reference_pattern("Sci-Fi Green")
+def sci_fi_green_pattern(pos_x: np.ndarray, pos_y: np.ndarray) -> tuple:
+    """Matrix-like green dominance on a diagonal grid with blue shadows"""
+    grid = (pos_x + pos_y) % 0.3 < 0.15
+    return (
+        np.where(grid, 0.1, 0.05 + pos_x * 0.1),
+        np.where(grid, 0.8 + pos_y * 0.15, 0.4 + pos_y * 0.3),
+        np.where(grid, 0.2 + pos_y * 0.1, 0.15 + pos_x * 0.05),
+    )
+
+@reference_pattern("Film Noir")
+def film_noir_pattern(pos_x: np.ndarray, pos_y: np.ndarray) -> tuple:
+    """High contrast with deep shadows and bright highlights in the extreme zones"""
+    intensity = np.where(
+        pos_y > 0.8, 0.9,
+        np.where(pos_y < 0.3, 0.05, 0.3 + pos_x * 0.4)
+    )
+    return intensity, intensity * 0.95, intensity * 0.9
+
+@reference_pattern("Warm Vintage")
+def warm_vintage_pattern(pos_x: np.ndarray, pos_y: np.ndarray) -> tuple:
+    """Warm, lifted shadows with golden highlights"""
+    return 0.7 + pos_y * 0.2, 0.6 + pos_y * 0.15, 0.4 + pos_y * 0.1
+
+@reference_pattern("Cool Digital")
+def cool_digital_pattern(pos_x: np.ndarray, pos_y: np.ndarray) -> tuple:
+    """Cool blue dominance with clean highlights"""
+    return 0.3 + pos_x * 0.2, 0.4 + pos_x * 0.3, 0.8 + pos_y * 0.15
+
+@reference_pattern("Warm Red Film")
+def warm_red_film_pattern(pos_x: np.ndarray, pos_y: np.ndarray) -> tuple:
+    """Strong red dominance with warm undertones and a central skin tone area"""
+    base_red = 0.8 + pos_y * 0.15
+    base_green = 0.3 + pos_x * 0.4
+    base_blue = 0.2 + pos_x * 0.3
+    skin = (0.3 < pos_y) & (pos_y < 0.7) & (0.2 < pos_x) & (pos_x < 0.8)
+    return (
+        np.where(skin, base_red * 1.1, base_red),
+        np.where(skin, base_green * 1.2, base_green),
+        np.where(skin, base_blue * 0.8, base_blue),
+    )
+
+@reference_pattern("Bleach Bypass")
+def bleach_bypass_pattern(pos_x: np.ndarray, pos_y: np.ndarray) -> tuple:
+    """Desaturated high contrast with silver retention"""
+    intensity = 0.1 + pos_y * 0.8
+    return intensity * 1.05, intensity, intensity * 0.95
+
+def create_reference_image(look: CinematicLook, size: tuple = (256, 256), seed: int = None) -> np.ndarray:
     """Create a reference image based on cinematic look characteristics using realistic color distributions"""
-    ref_img = np.zeros((*size, 3), dtype=np.float32)
     height, width = size
+    rng = np.random.default_rng(seed)
     
-    # Create more realistic image-like reference with varied color regions
-    # This simulates actual photographic color distribution patterns
+    # Normalized pixel coordinates, broadcast against each other by the pattern generators
+    pos_x = (np.arange(width) / width)[np.newaxis, :]
+    pos_y = (np.arange(height) / height)[:, np.newaxis]
     
-    if look.name == "Orange & Teal":
-        # Create a realistic sunset/urban scene color pattern
-        for y in range(height):
-            for x in range(width):
-                pos_x = x / width
-                pos_y = y / height
-                
-                # Simulate warm highlights (orange) and cool shadows (teal)
-                if pos_y < 0.4:  # Sky area - cooler tones
-                    ref_img[y, x] = [0.15 + pos_x * 0.1, 0.35 + pos_x * 0.15, 0.55 + pos_x * 0.2]
-                elif pos_y < 0.7:  # Mid area - transition
-                    warmth = pos_x * 0.6 + 0.2
-                    ref_img[y, x] = [warmth, warmth * 0.7, warmth * 0.4]
-                else:  # Ground/subject area - warmer tones
-                    ref_img[y, x] = [0.85 + pos_x * 0.1, 0.55 + pos_x * 0.1, 0.25 + pos_x * 0.05]
-                    
-    elif look.name == "Sci-Fi Green":
-        # Create a cyberpunk/sci-fi color pattern
-        for y in range(height):
-            for x in range(width):
-                pos_x = x / width
-                pos_y = y / height
-                
-                # Matrix-like green dominance with blue shadows
-                if (pos_x + pos_y) % 0.3 < 0.15:  # Grid pattern
-                    ref_img[y, x] = [0.1, 0.8 + pos_y * 0.15, 0.2 + pos_y * 0.1]
-                else:
-                    ref_img[y, x] = [0.05 + pos_x * 0.1, 0.4 + pos_y * 0.3, 0.15 + pos_x * 0.05]
-                    
-    elif look.name == "Film Noir":
-        # Create high contrast B&W with selective color
-        for y in range(height):
-            for x in range(width):
-                pos_x = x / width
-                pos_y = y / height
-                
-                # High contrast with deep shadows and bright highlights
-                if pos_y < 0.3 or pos_y > 0.8:  # Extreme zones
-                    intensity = 0.9 if pos_y > 0.8 else 0.05
-                    ref_img[y, x] = [intensity, intensity * 0.95, intensity * 0.9]
-                else:
-                    intensity = 0.3 + pos_x * 0.4
-                    ref_img[y, x] = [intensity, intensity * 0.95, intensity * 0.9]
-                    
-    elif look.name == "Warm Vintage":
-        # Create warm, faded film look
-        for y in range(height):
-            for x in range(width):
-                pos_x = x / width
-                pos_y = y / height
-                
-                # Warm, lifted shadows with golden highlights
-                base_r = 0.7 + pos_y * 0.2
-                base_g = 0.6 + pos_y * 0.15
-                base_b = 0.4 + pos_y * 0.1
-                ref_img[y, x] = [base_r, base_g, base_b]
-                
-    elif look.name == "Cool Digital":
-        # Create modern digital look
-        for y in range(height):
-            for x in range(width):
-                pos_x = x / width
-                pos_y = y / height
-                
-                # Cool blue dominance with clean highlights
-                ref_img[y, x] = [0.3 + pos_x * 0.2, 0.4 + pos_x * 0.3, 0.8 + pos_y * 0.15]
-                
-    elif look.name == "Warm Red Film":
-        # Create warm red film look
-        for y in range(height):
-            for x in range(width):
-                pos_x = x / width
-                pos_y = y / height
-                
-                # Strong red dominance with warm undertones
-                base_red = 0.8 + pos_y * 0.15  # High red values
-                base_green = 0.3 + pos_x * 0.4  # Moderate green for warmth
-                base_blue = 0.2 + pos_x * 0.3   # Lower blue for warmth
-                
-                # Add some variation for skin tones
-                if 0.3 < pos_y < 0.7 and 0.2 < pos_x < 0.8:  # Central skin tone area
-                    base_red *= 1.1
-                    base_green *= 1.2
-                    base_blue *= 0.8
-                
-                ref_img[y, x] = [base_red, base_green, base_blue]
-                
-    else:  # Bleach Bypass
-        # Create desaturated high contrast look
-        for y in range(height):
-            for x in range(width):
-                pos_x = x / width
-                pos_y = y / height
-                
-                # Desaturated with silver retention effect
-                intensity = 0.1 + pos_y * 0.8
-                ref_img[y, x] = [intensity * 1.05, intensity, intensity * 0.95]
+    # Looks without a registered pattern use the desaturated Bleach Bypass pattern
+    generator = REFERENCE_PATTERNS.get(look.name, bleach_bypass_pattern)
+    ref_img = np.empty((height, width, 3), dtype=np.float32)
+    for channel, plane in enumerate(generator(pos_x, pos_y)):
+        ref_img[:, :, channel] = plane
     
     # Add realistic noise and texture variation
-    noise = np.random.normal(0, 0.02, ref_img.shape)
+    noise = rng.normal(0, 0.02, ref_img.shape)
     ref_img = np.clip(ref_img + noise, 0, 1)
     
     # Add some color variation to make transfer more effective
-    color_variation = np.random.uniform(-0.05, 0.05, ref_img.shape)
+    color_variation = rng.uniform(-0.05, 0.05, ref_img.shape)
     ref_img = np.clip(ref_img + color_variation, 0, 1)
     
     # Enhance color saturation and contrast to ensure strong color transfer
@@ -269,6 +488,47 @@ def create_reference_image(look: CinematicLook, size: tuple = (256, 256)) -> np.
     
     return ref_img
 
+@lru_cache(maxsize=REFERENCE_CACHE_SIZE)
+def get_reference_image(look_key: str, size: tuple, seed: int = REFERENCE_SEED) -> np.ndarray:
+    """Return the reference image for a CINEMATIC_LOOKS key, synthesizing it only on a cache miss
+    
+    The cached array is shared between requests, so it is returned read-only.
+    """
+    ref_img = create_reference_image(CINEMATIC_LOOKS[look_key], tuple(size), seed)
+    ref_img.setflags(write=False)
+    return ref_img
+
+@lru_cache(maxsize=None)
+def get_reference_analysis(look_key: str) -> ColorAnalysis:
+    """Return analyze_reference_colors for a look's reference at the canonical resolution
+    
+    Computed once per look and shared between requests; callers must not mutate it.
+    """
+    return analyze_reference_colors(get_reference_image(look_key, REFERENCE_CANONICAL_SIZE))
+
+def warm_reference_cache(sizes: List[tuple]):
+    """Pre-synthesize the reference image of every cinematic look for the given sizes"""
+    for size in sizes:
+        for look_key in CINEMATIC_LOOKS:
+            get_reference_image(look_key, size)
+
+def warm_caches():
+    """Fill the reference caches of the current process (the app or a LUT worker)"""
+    warm_reference_cache(REFERENCE_WARMUP_SIZES)
+    if REFERENCE_CANONICAL_SIZE:
+        for look_key in CINEMATIC_LOOKS:
+            get_reference_analysis(look_key)
+
+def init_lut_worker(fallback_count):
+    """Initializer of the LUT worker processes: share the app's fallback counter, warm caches"""
+    global lut_fallback_count
+    lut_fallback_count = fallback_count
+    warm_caches()
+
+def count_lut_fallback():
+    with lut_fallback_count.get_lock():
+        lut_fallback_count.value += 1
+
 def enhance_reference_colors(ref_img: np.ndarray, look: CinematicLook) -> np.ndarray:
     """Enhance reference image colors to ensure strong color transfer"""
     enhanced = ref_img.copy()
@@ -288,8 +548,65 @@ def enhance_reference_colors(ref_img: np.ndarray, look: CinematicLook) -> np.nda
     
     return np.clip(enhanced, 0, 1)
 
-async def analyze_image_for_cinematic_look(image_data: bytes) -> ColorMatcherResponse:
-    """Use AI to determine the best cinematic look for the uploaded image"""
+def verify_image(image_data: bytes):
+    """Check that an upload has a readable image header, without decoding the pixels"""
+    Image.open(io.BytesIO(image_data)).verify()
+
+async def check_image(image_data: bytes):
+    """Reject an upload PIL cannot identify as an image with a 400"""
+    try:
+        await asyncio.to_thread(verify_image, image_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+
+async def call_gemini(model, contents: list, generation_config):
+    """Call Gemini under the concurrency cap and timeout, recording its latency by outcome"""
+    async with gemini_semaphore:
+        with span("gemini"):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                response = await asyncio.wait_for(
+                    model.generate_content_async(contents, generation_config=generation_config),
+                    timeout=GEMINI_TIMEOUT
+                )
+                outcome = "success"
+                return response
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise
+            finally:
+                gemini_request_duration.observe(time.perf_counter() - start, outcome=outcome)
+
+async def analyze_image_for_cinematic_look(image_data: bytes, image_hash: str = None) -> ColorMatcherResponse:
+    """Use AI to determine the best cinematic look for the uploaded image
+    
+    Successful analyses are cached under image_hash (see content_hash); fallbacks are not.
+    Uploads that are not readable images raise a 400 HTTPException instead of reaching Gemini.
+    """
+    if image_hash:
+        cached = await analysis_cache.get_async(image_hash)
+        if cached is not None:
+            return ColorMatcherResponse(**cached)
+    
+    # Uploads that are not images are rejected before they use Gemini quota
+    await check_image(image_data)
+    
+    # Near-duplicates (re-encoded, resized) reuse a recent analysis instead of calling Gemini
+    fingerprint = None
+    if near_duplicate_index is not None:
+        try:
+            with span("fingerprint"):
+                fingerprint = await asyncio.to_thread(compute_image_fingerprint, image_data)
+        except Exception:
+            fingerprint = None
+    if fingerprint is not None:
+        cached = near_duplicate_index.nearest(fingerprint)
+        if cached is not None:
+            if image_hash:
+                analysis_cache.set(image_hash, cached)
+            return ColorMatcherResponse(**cached)
+    
     try:
         model = genai.GenerativeModel('gemini-2.5-flash')
         image_part = {
@@ -331,7 +648,8 @@ Choose the look that would create the most cinematic and professional result."""
             top_p=0.8
         )
 
-        response = model.generate_content([prompt, image_part], generation_config=generation_config)
+        # Await the model without blocking the event loop, so other requests keep being served
+        response = await call_gemini(model, [prompt, image_part], generation_config)
         
         if not response.text:
             raise Exception("Empty response from Gemini API")
@@ -348,11 +666,20 @@ Choose the look that would create the most cinematic and professional result."""
                 raise ValueError("No JSON found in response")
             json_str = response_text[start:end]
 
-        result = json.loads(json_str)
-        return ColorMatcherResponse(**result)
+        result = ColorMatcherResponse(**json.loads(json_str))
+        # Unknown looks would fail every LUT build, so they fall back instead of being cached
+        if result.cinematic_look not in CINEMATIC_LOOKS:
+            raise ValueError(f"Unknown cinematic look: {result.cinematic_look}")
+        if image_hash:
+            analysis_cache.set(image_hash, result.model_dump())
+        if fingerprint is not None:
+            near_duplicate_index.add(fingerprint, result.model_dump())
+        return result
 
     except Exception as e:
         # Fallback to warm_vintage for universal appeal
+        global analysis_fallback_count
+        analysis_fallback_count += 1
         return ColorMatcherResponse(
             analysis="Fallback analysis - using versatile warm vintage look",
             cinematic_look="warm_vintage",
@@ -360,8 +687,26 @@ Choose the look that would create the most cinematic and professional result."""
             confidence=0.7
         )
 
-def generate_lut_from_color_transfer(source_img: np.ndarray, reference_img: np.ndarray, method: str = "mkl") -> np.ndarray:
-    """Generate 3D LUT using color-matcher for professional color transfer"""
+# Method names Gemini may recommend that color-matcher knows under another name
+COLOR_MATCHER_METHOD_ALIASES = {"hist_match": "hm"}
+
+def color_matcher_method(method: str) -> str:
+    """Resolve a recommended method to a color-matcher method, defaulting to mkl
+    
+    color-matcher raises BaseException (not Exception) for unknown methods.
+    """
+    method = COLOR_MATCHER_METHOD_ALIASES.get(method, method)
+    return method if method in COLOR_MATCHER_METHODS else "mkl"
+
+def generate_lut_from_color_transfer(source_img: np.ndarray, reference_img: np.ndarray, method: str = "mkl", reference_analysis: ColorAnalysis = None, size: int = LUT_SIZE) -> np.ndarray:
+    """Generate 3D LUT using color-matcher for professional color transfer
+    
+    reference_analysis may be passed in precomputed (see get_reference_analysis); the
+    reference image does not need to match the source size.
+    """
+    if reference_analysis is None:
+        reference_analysis = analyze_reference_colors(reference_img)
+    
     try:
         # Enhance reference colors for better matching
         from color_matcher.normalizer import Normalizer
@@ -375,120 +720,95 @@ def generate_lut_from_color_transfer(source_img: np.ndarray, reference_img: np.n
         cm = ColorMatcher()
         
         # Perform color transfer
-        matched_img = cm.transfer(src=source_norm, ref=reference_norm, method=method)
-        
-        # Analyze both source and matched images
-        source_analysis = analyze_image_characteristics(source_img)
-        reference_analysis = analyze_reference_colors(reference_img)
-        
-        # Generate LUT based on the color transfer
-        lut = np.zeros((LUT_SIZE, LUT_SIZE, LUT_SIZE, 3), dtype=np.float32)
-        
-        for r in range(LUT_SIZE):
-            for g in range(LUT_SIZE):
-                for b in range(LUT_SIZE):
-                    # Normalized input color [0,1]
-                    input_color = np.array([
-                        r / (LUT_SIZE - 1),
-                        g / (LUT_SIZE - 1), 
-                        b / (LUT_SIZE - 1)
-                    ], dtype=np.float32)
-                    
-                    # Apply professional color grading transformation
-                    output_color = apply_professional_color_grading(
-                        input_color, 
-                        source_analysis, 
-                        reference_analysis
-                    )
-                    
-                    # Store in LUT
-                    lut[r, g, b] = output_color
+        with span("transfer"):
+            matched_img = cm.transfer(src=source_norm, ref=reference_norm, method=color_matcher_method(method))
         
-        return lut
+        # Fit the lattice to the (source, matched) pixel pairs so the LUT reproduces the transfer
+        with span("lut_fit"):
+            return fit_lut_from_pairs(source_img, matched_img, size)
         
     except Exception as e:
         # Fallback to reference analysis method
-        reference_analysis = analyze_reference_colors(reference_img)
-        return create_adaptive_lut(reference_analysis)
+        count_lut_fallback()
+        with span("adaptive_lut"):
+            return create_adaptive_lut(reference_analysis, size)
 
-def analyze_reference_colors(ref_img: np.ndarray) -> dict:
-    """Analyze reference image to extract color characteristics"""
-    # Convert to different luminance ranges
-    luminance = 0.299 * ref_img[:, :, 0] + 0.587 * ref_img[:, :, 1] + 0.114 * ref_img[:, :, 2]
+def analyze_reference_colors(ref_img: np.ndarray) -> ColorAnalysis:
+    """Analyze reference image to extract color characteristics
     
-    # Analyze shadows, midtones, highlights separately
-    shadows_mask = luminance < 0.3
-    midtones_mask = (luminance >= 0.3) & (luminance <= 0.7) 
-    highlights_mask = luminance > 0.7
+    References split their tones at 30% and 70% luminance, sources at 25% and 75%.
+    """
+    return characteristics_from_statistics(image_statistics(ref_img, REFERENCE_TONE_LIMITS))
+
+def create_adaptive_lut(ref_analysis: ColorAnalysis, size: int = LUT_SIZE) -> np.ndarray:
+    """Create visible but safe LUT based on reference image
     
-    analysis = {}
+    Vectorized over the whole lattice; bit-identical to create_adaptive_lut_scalar.
+    """
+    # Get reference characteristics
+    ref_shadows = ref_analysis['shadows']['rgb_avg']
+    ref_midtones = ref_analysis['midtones']['rgb_avg']
+    ref_highlights = ref_analysis['highlights']['rgb_avg']
     
-    # Get dominant colors for each range
-    if np.any(shadows_mask):
-        shadows_avg = np.mean(ref_img[shadows_mask], axis=0)
-    else:
-        shadows_avg = np.array([0.1, 0.1, 0.1])
+    # Calculate safe adjustment factors
+    is_warm = ref_analysis['temperature_bias'] == 'warm'
+    warmth_strength = min(ref_analysis['warmth_strength'], 0.3)
+    temp_adjustment = 0.05 if is_warm else -0.05  # 5% adjustment
     
-    if np.any(midtones_mask):
-        midtones_avg = np.mean(ref_img[midtones_mask], axis=0)
-    else:
-        midtones_avg = np.array([0.5, 0.5, 0.5])
-        
-    if np.any(highlights_mask):
-        highlights_avg = np.mean(ref_img[highlights_mask], axis=0)
-    else:
-        highlights_avg = np.array([0.9, 0.9, 0.9])
+    # Normalized input coordinates [0,1], kept in float64 like the per-node Python floats
+    axis = np.arange(size) / (size - 1)
+    output = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
     
-    analysis['dominant_colors'] = {
-        'shadows': shadows_avg,
-        'midtones': midtones_avg, 
-        'highlights': highlights_avg
-    }
+    # Calculate luminance to determine tone range
+    luminance = 0.299 * output[..., 0] + 0.587 * output[..., 1] + 0.114 * output[..., 2]
     
-    # Calculate overall color bias
-    overall_avg = np.mean(ref_img.reshape(-1, 3), axis=0)
+    # Skip only pure black; the rest splits into shadows, highlights and midtones
+    graded_mask = luminance > 0.02
+    shadows_mask = graded_mask & (luminance < 0.33)
+    highlights_mask = graded_mask & ~shadows_mask & (luminance > 0.66)
+    midtones_mask = graded_mask & ~shadows_mask & ~highlights_mask
     
-    # Determine temperature bias (red vs blue)
-    if overall_avg[0] > overall_avg[2]:
-        analysis['temperature_bias'] = 'warm'
-        analysis['warmth_strength'] = (overall_avg[0] - overall_avg[2]) * 2
-    else:
-        analysis['temperature_bias'] = 'cool' 
-        analysis['warmth_strength'] = (overall_avg[2] - overall_avg[0]) * 2
+    # Shift each tone range toward the reference color with its own influence
+    for ref_color, mask, influence in (
+        (ref_shadows, shadows_mask, 0.15),
+        (ref_highlights, highlights_mask, 0.12),
+        (ref_midtones, midtones_mask, 0.18),
+    ):
+        band_luminance = luminance[mask]
+        for channel in range(3):
+            output[..., channel][mask] += (ref_color[channel] - band_luminance) * influence
     
-    # Determine color cast
-    max_channel = np.argmax(overall_avg)
-    if max_channel == 0:
-        analysis['color_cast'] = 'red'
-    elif max_channel == 1:
-        analysis['color_cast'] = 'green'
+    # Apply temperature bias
+    if is_warm:
+        output[..., 0][graded_mask] *= (1 + temp_adjustment * warmth_strength)
+        output[..., 2][graded_mask] *= (1 - temp_adjustment * warmth_strength * 0.7)
     else:
-        analysis['color_cast'] = 'blue'
-        
-    analysis['cast_strength'] = np.max(overall_avg) - np.min(overall_avg)
+        output[..., 2][graded_mask] *= (1 + abs(temp_adjustment) * warmth_strength)
+        output[..., 0][graded_mask] *= (1 - abs(temp_adjustment) * warmth_strength * 0.7)
     
-    return analysis
+    # Ensure values stay in valid range [0,1]
+    return np.clip(output, 0, 1).astype(np.float32)
 
-def create_adaptive_lut(ref_analysis: dict) -> np.ndarray:
-    """Create visible but safe LUT based on reference image"""
-    lut = np.zeros((LUT_SIZE, LUT_SIZE, LUT_SIZE, 3), dtype=np.float32)
+def create_adaptive_lut_scalar(ref_analysis: ColorAnalysis, size: int = LUT_SIZE) -> np.ndarray:
+    """Per-node reference implementation of create_adaptive_lut, kept for regression checks"""
+    lut = np.zeros((size, size, size, 3), dtype=np.float32)
     
     # Get reference characteristics
-    ref_shadows = ref_analysis['dominant_colors']['shadows']
-    ref_midtones = ref_analysis['dominant_colors']['midtones']
-    ref_highlights = ref_analysis['dominant_colors']['highlights']
+    ref_shadows = ref_analysis['shadows']['rgb_avg']
+    ref_midtones = ref_analysis['midtones']['rgb_avg']
+    ref_highlights = ref_analysis['highlights']['rgb_avg']
     
     # Calculate safe adjustment factors
     is_warm = ref_analysis['temperature_bias'] == 'warm'
-    warmth_strength = min(ref_analysis.get('warmth_strength', 0.1), 0.3)
+    warmth_strength = min(ref_analysis['warmth_strength'], 0.3)
     
-    for r in range(LUT_SIZE):
-        for g in range(LUT_SIZE):
-            for b in range(LUT_SIZE):
+    for r in range(size):
+        for g in range(size):
+            for b in range(size):
                 # Create normalized input coordinates [0,1]
-                input_r = r / (LUT_SIZE - 1)
-                input_g = g / (LUT_SIZE - 1) 
-                input_b = b / (LUT_SIZE - 1)
+                input_r = r / (size - 1)
+                input_g = g / (size - 1) 
+                input_b = b / (size - 1)
                 
                 # START WITH IDENTITY
                 output_r = input_r
@@ -537,52 +857,101 @@ def create_adaptive_lut(ref_analysis: dict) -> np.ndarray:
                 lut[r, g, b] = np.clip([output_r, output_g, output_b], 0, 1)
     return lut
 
-def analyze_image_characteristics(img: np.ndarray) -> dict:
-    """Analyze image characteristics like professional color grading software"""
-    # Convert to different color spaces for analysis
+# Luminance splitting shadows/midtones and midtones/highlights for sources and references
+SOURCE_TONE_LIMITS = (0.25, 0.75)
+REFERENCE_TONE_LIMITS = (0.3, 0.7)
+
+# Statistics an analysis reports for a tonal range no pixel falls into:
+# (rgb_avg, saturation_avg, luminance_avg), in luminance order
+TONE_DEFAULTS = {
+    'shadows': ([0.1, 0.1, 0.1], 0.3, 0.15),
+    'midtones': ([0.5, 0.5, 0.5], 0.5, 0.5),
+    'highlights': ([0.9, 0.9, 0.9], 0.2, 0.85)
+}
+
+def image_band_statistics(img: np.ndarray, tone_limits: tuple = SOURCE_TONE_LIMITS) -> dict:
+    """Partial sums for a ColorAnalysis over one row band of an image"""
     img_uint8 = (img * 255).astype(np.uint8)
-    hsv = cv2.cvtColor(img_uint8, cv2.COLOR_RGB2HSV).astype(np.float32) / 255.0
-    lab = cv2.cvtColor(img_uint8, cv2.COLOR_RGB2LAB).astype(np.float32)
+    saturation = cv2.cvtColor(img_uint8, cv2.COLOR_RGB2HSV)[:, :, 1].astype(np.float32) / 255.0
     
     # Calculate luminance (similar to Lightroom/DaVinci)
     luminance = 0.299 * img[:, :, 0] + 0.587 * img[:, :, 1] + 0.114 * img[:, :, 2]
     
-    # Analyze shadows, midtones, highlights (like professional software)
-    shadows_mask = luminance < 0.25
-    midtones_mask = (luminance >= 0.25) & (luminance <= 0.75)
-    highlights_mask = luminance > 0.75
+    # Label shadows (0), midtones (1) and highlights (2), then sum per label in one pass each
+    shadow_limit, highlight_limit = tone_limits
+    tones = (luminance >= shadow_limit).astype(np.intp) + (luminance > highlight_limit)
+    tones = tones.ravel()
     
-    analysis = {
-        'shadows': {
-            'rgb_avg': np.mean(img[shadows_mask], axis=0) if np.any(shadows_mask) else np.array([0.1, 0.1, 0.1]),
-            'saturation_avg': np.mean(hsv[shadows_mask, 1]) if np.any(shadows_mask) else 0.3,
-            'luminance_avg': np.mean(luminance[shadows_mask]) if np.any(shadows_mask) else 0.15
-        },
-        'midtones': {
-            'rgb_avg': np.mean(img[midtones_mask], axis=0) if np.any(midtones_mask) else np.array([0.5, 0.5, 0.5]),
-            'saturation_avg': np.mean(hsv[midtones_mask, 1]) if np.any(midtones_mask) else 0.5,
-            'luminance_avg': np.mean(luminance[midtones_mask]) if np.any(midtones_mask) else 0.5
-        },
-        'highlights': {
-            'rgb_avg': np.mean(img[highlights_mask], axis=0) if np.any(highlights_mask) else np.array([0.9, 0.9, 0.9]),
-            'saturation_avg': np.mean(hsv[highlights_mask, 1]) if np.any(highlights_mask) else 0.2,
-            'luminance_avg': np.mean(luminance[highlights_mask]) if np.any(highlights_mask) else 0.85
-        },
-        'overall': {
-            'temperature': estimate_color_temperature(img),
-            'tint': estimate_tint(img),
-            'contrast': np.std(luminance),
-            'saturation_avg': np.mean(hsv[:, :, 1])
+    def tone_sums(values: np.ndarray) -> np.ndarray:
+        return np.bincount(tones, weights=values.ravel(), minlength=3)
+    
+    return {
+        'tone_counts': np.bincount(tones, minlength=3),
+        'tone_rgb_sums': np.stack([tone_sums(img[:, :, channel]) for channel in range(3)], axis=-1),
+        'tone_saturation_sums': tone_sums(saturation),
+        'tone_luminance_sums': tone_sums(luminance),
+        'luminance_sq_sum': np.square(luminance, dtype=np.float64).sum()
+    }
+
+def image_statistics(img: np.ndarray, tone_limits: tuple = SOURCE_TONE_LIMITS) -> dict:
+    """Sums behind a ColorAnalysis, gathered per row band on the image scheduler's threads
+    and merged"""
+    return image_scheduler.map_reduce(
+        lambda band: image_band_statistics(img[band], tone_limits), img.shape[0]
+    )
+
+def analyze_image_characteristics(img: np.ndarray) -> ColorAnalysis:
+    """Analyze image characteristics like professional color grading software"""
+    return characteristics_from_statistics(image_statistics(img))
+
+def characteristics_from_statistics(stats: dict) -> ColorAnalysis:
+    """Turn image_statistics sums into a ColorAnalysis
+    
+    Sums added up over several images (sum_partials) describe them as if they were one image.
+    """
+    counts = stats['tone_counts']
+    pixels = counts.sum()
+    rgb_avg = stats['tone_rgb_sums'].sum(axis=0) / pixels
+    luminance_avg = stats['tone_luminance_sums'].sum() / pixels
+    
+    analysis = {}
+    
+    # Analyze shadows, midtones, highlights (like professional software)
+    for tone_index, (tone, (default_rgb, default_saturation, default_luminance)) in enumerate(TONE_DEFAULTS.items()):
+        count = counts[tone_index]
+        analysis[tone] = {
+            'rgb_avg': stats['tone_rgb_sums'][tone_index] / count if count else np.array(default_rgb),
+            'saturation_avg': stats['tone_saturation_sums'][tone_index] / count if count else default_saturation,
+            'luminance_avg': stats['tone_luminance_sums'][tone_index] / count if count else default_luminance
         }
+    
+    analysis['overall'] = {
+        'rgb_avg': rgb_avg,
+        'temperature': estimate_color_temperature(rgb_avg),
+        'tint': estimate_tint(rgb_avg),
+        'contrast': np.sqrt(max(stats['luminance_sq_sum'] / pixels - luminance_avg ** 2, 0.0)),
+        'saturation_avg': stats['tone_saturation_sums'].sum() / pixels
     }
     
+    # Determine temperature bias (red vs blue)
+    if rgb_avg[0] > rgb_avg[2]:
+        analysis['temperature_bias'] = 'warm'
+        analysis['warmth_strength'] = (rgb_avg[0] - rgb_avg[2]) * 2
+    else:
+        analysis['temperature_bias'] = 'cool'
+        analysis['warmth_strength'] = (rgb_avg[2] - rgb_avg[0]) * 2
+    
+    # Determine color cast
+    analysis['color_cast'] = ('red', 'green', 'blue')[np.argmax(rgb_avg)]
+    analysis['cast_strength'] = np.max(rgb_avg) - np.min(rgb_avg)
+    
     return analysis
 
-def estimate_color_temperature(img: np.ndarray) -> float:
-    """Estimate color temperature like professional software"""
+def estimate_color_temperature(rgb_avg: np.ndarray) -> float:
+    """Estimate color temperature like professional software from the mean RGB"""
     # Calculate red/blue ratio (simplified temperature estimation)
-    red_avg = np.mean(img[:, :, 0])
-    blue_avg = np.mean(img[:, :, 2])
+    red_avg = rgb_avg[0]
+    blue_avg = rgb_avg[2]
     
     if blue_avg > 0:
         rb_ratio = red_avg / blue_avg
@@ -595,15 +964,15 @@ def estimate_color_temperature(img: np.ndarray) -> float:
             return 5500  # Neutral
     return 5500
 
-def estimate_tint(img: np.ndarray) -> float:
-    """Estimate tint like professional software"""
+def estimate_tint(rgb_avg: np.ndarray) -> float:
+    """Estimate tint like professional software from the mean RGB"""
     # Calculate green bias
-    green_avg = np.mean(img[:, :, 1])
-    rg_avg = (np.mean(img[:, :, 0]) + np.mean(img[:, :, 2])) / 2
+    green_avg = rgb_avg[1]
+    rg_avg = (rgb_avg[0] + rgb_avg[2]) / 2
     
     return (green_avg - rg_avg) * 100  # Tint offset
 
-def apply_professional_color_grading(input_color: np.ndarray, source_analysis: dict, reference_analysis: dict) -> np.ndarray:
+def apply_professional_color_grading(input_color: np.ndarray, source_analysis: ColorAnalysis, reference_analysis: ColorAnalysis) -> np.ndarray:
     """Apply conservative professional color grading transformations"""
     r, g, b = input_color
     
@@ -663,7 +1032,119 @@ def apply_professional_color_grading(input_color: np.ndarray, source_analysis: d
     
     return np.clip(final_color, 0, 1)
 
-def apply_conservative_color_grading(input_color: np.ndarray, source_analysis: dict, reference_analysis: dict) -> np.ndarray:
+def create_identity_lattice(size: int = LUT_SIZE) -> np.ndarray:
+    """Create the identity (size, size, size, 3) RGB lattice indexed as [r, g, b]"""
+    # Same node values as r / (size - 1) computed per node in float64, then stored as float32
+    axis = np.arange(size) / (size - 1)
+    r, g, b = np.meshgrid(axis, axis, axis, indexing='ij')
+    return np.stack([r, g, b], axis=-1).astype(np.float32)
+
+def smooth_lattice(values: np.ndarray, passes: int) -> np.ndarray:
+    """Blur a (size, size, size, ...) lattice with separable [1, 2, 1] / 4 passes, edges clamped"""
+    for _ in range(passes):
+        for axis in range(3):
+            moved = np.moveaxis(values, axis, 0)
+            padded = np.concatenate([moved[:1], moved, moved[-1:]])
+            values = np.moveaxis((padded[:-2] + 2 * padded[1:-1] + padded[2:]) / 4, 0, axis)
+    return values
+
+def fit_lut_from_pairs(source: np.ndarray, target: np.ndarray, size: int = LUT_SIZE) -> np.ndarray:
+    """Fit a 3D LUT that maps source pixel colors to the corresponding target pixel colors
+    
+    Each pair is scattered onto the 8 lattice nodes around its source color with trilinear
+    weights, accumulating weights and weighted color offsets per node with np.bincount. The
+    sums are smoothed and divided (normalized convolution); the prior weight pulls nodes with
+    little nearby data toward identity, which also fills the holes no pixel reaches.
+    """
+    source = np.clip(source.reshape(-1, 3).astype(np.float64), 0, 1)
+    offsets = target.reshape(-1, 3).astype(np.float64) - source
+    
+    position = source * (size - 1)
+    index = np.minimum(position.astype(np.intp), size - 2)
+    upper = position - index
+    lower = 1 - upper
+    
+    nodes = size ** 3
+    weight_sums = np.zeros(nodes)
+    offset_sums = np.zeros((nodes, 3))
+    for dr in (0, 1):
+        for dg in (0, 1):
+            for db in (0, 1):
+                node = ((index[:, 0] + dr) * size + index[:, 1] + dg) * size + index[:, 2] + db
+                weights = (
+                    (upper[:, 0] if dr else lower[:, 0])
+                    * (upper[:, 1] if dg else lower[:, 1])
+                    * (upper[:, 2] if db else lower[:, 2])
+                )
+                weight_sums += np.bincount(node, weights=weights, minlength=nodes)
+                for channel in range(3):
+                    offset_sums[:, channel] += np.bincount(node, weights=weights * offsets[:, channel], minlength=nodes)
+    
+    occupied = weight_sums > 0
+    prior = LUT_FIT_PRIOR_WEIGHT * weight_sums[occupied].mean() if np.any(occupied) else 1.0
+    shape = (size, size, size)
+    weight_sums = smooth_lattice(weight_sums.reshape(shape), LUT_FIT_SMOOTHING_PASSES)
+    offset_sums = smooth_lattice(offset_sums.reshape(shape + (3,)), LUT_FIT_SMOOTHING_PASSES)
+    
+    lut = create_identity_lattice(size) + offset_sums / (weight_sums + prior)[..., np.newaxis]
+    return np.clip(lut, 0, 1).astype(np.float32)
+
+def apply_professional_color_grading_lattice(lattice: np.ndarray, source_analysis: ColorAnalysis, reference_analysis: ColorAnalysis) -> np.ndarray:
+    """Apply apply_professional_color_grading to every color of a (..., 3) array at once
+    
+    Produces bit-identical results to calling the scalar function on each color. Every tone
+    range is graded in the dtype its color shift carries (fallback averages are float64, measured
+    averages float32), exactly as the per-color path would promote it.
+    """
+    colors = lattice.reshape(-1, 3)
+    output = np.empty(colors.shape, dtype=np.float32)
+    
+    # Calculate luminance to determine shadows/midtones/highlights
+    luminance = 0.299 * colors[:, 0] + 0.587 * colors[:, 1] + 0.114 * colors[:, 2]
+    shadows_mask = luminance < 0.25
+    highlights_mask = luminance > 0.75
+    midtones_mask = ~(shadows_mask | highlights_mask)
+    
+    # Temperature and tint differences are shared by every tone range
+    temp_diff = reference_analysis['overall']['temperature'] - source_analysis['overall']['temperature']
+    tint_diff = reference_analysis['overall']['tint'] - source_analysis['overall']['tint']
+    
+    for tone, mask, weight in (
+        ('shadows', shadows_mask, 0.08),
+        ('highlights', highlights_mask, 0.06),
+        ('midtones', midtones_mask, 0.12),
+    ):
+        if not np.any(mask):
+            continue
+        input_colors = colors[mask]
+        
+        # Calculate and limit color shift to prevent extreme changes
+        color_shift = reference_analysis[tone]['rgb_avg'] - source_analysis[tone]['rgb_avg']
+        color_shift = np.clip(color_shift, -0.3, 0.3)
+        adjusted = input_colors + (color_shift * weight)
+        
+        # Very subtle temperature adjustment (red/blue balance)
+        if abs(temp_diff) > 100:
+            if temp_diff > 0:
+                adjusted[:, 0] *= (1 + temp_diff / 50000)
+                adjusted[:, 2] *= (1 - temp_diff / 80000)
+            else:
+                adjusted[:, 2] *= (1 + abs(temp_diff) / 50000)
+                adjusted[:, 0] *= (1 - abs(temp_diff) / 80000)
+        
+        # Very subtle tint adjustment (green/magenta balance)
+        if abs(tint_diff) > 0.05:
+            adjusted[:, 1] += tint_diff / 3000
+        
+        adjusted = np.clip(adjusted, 0, 1)
+        
+        # Blend with original to prevent extreme color shifts
+        blend_ratio = 0.85
+        output[mask] = np.clip(input_colors * blend_ratio + adjusted * (1 - blend_ratio), 0, 1)
+    
+    return output.reshape(lattice.shape)
+
+def apply_conservative_color_grading(input_color: np.ndarray, source_analysis: ColorAnalysis, reference_analysis: ColorAnalysis) -> np.ndarray:
     """Apply very conservative color grading as a safety fallback"""
     # Only apply minimal temperature and tint adjustments
     adjusted_color = input_color.copy()
@@ -694,73 +1175,424 @@ def apply_cinematic_adjustments(lut: np.ndarray, look: CinematicLook) -> np.ndar
     # The color shift in the main algorithm should be sufficient
     return lut
 
+def format_cube_rows(rows: np.ndarray) -> str:
+    """Format (M, 3) LUT entries as .cube data lines, identical to f"{value:.6f}" per value"""
+    values = np.ascontiguousarray(rows).ravel()
+    
+    # Fast path for float32 in [0, 10): value * 1e6 is exact in float64 (24 + 14 significant
+    # bits), so rint gives the same correctly rounded 6 decimals as Python's formatting, and
+    # every value is a fixed "d.dddddd" that can be written as bytes for the whole array at once
+    if values.dtype == np.float32:
+        scaled = np.rint(values.astype(np.float64) * 1e6)
+        if np.all(np.isfinite(scaled)) and not np.any(np.signbit(values)) and np.all(scaled < 1e7):
+            micros = scaled.astype(np.int64)
+            text = np.empty((values.size, 9), dtype=np.uint8)
+            text[:, 0] = micros // 1000000 + ord('0')
+            text[:, 1] = ord('.')
+            fraction = micros % 1000000
+            for column in range(7, 1, -1):
+                text[:, column] = fraction % 10 + ord('0')
+                fraction //= 10
+            # Space after R and G, newline after B
+            text[:, 8] = ord(' ')
+            text[2::3, 8] = ord('\n')
+            return text.tobytes().decode('ascii')
+    
+    return "".join(f"{r:.6f} {g:.6f} {b:.6f}\n" for r, g, b in values.reshape(-1, 3))
+
+def iter_cube_chunks(lut: np.ndarray, chunk_rows: int = 8192):
+    """Yield the .cube file for a 3D LUT array in chunks, header first"""
+    size = lut.shape[0]
+    yield (
+        "# LUTForge AI Generated LUT v2.0\n"
+        "# Created using professional color-matcher algorithms\n"
+        f"LUT_3D_SIZE {size}\n\n"
+    )
+    
+    # IMPORTANT: .cube format uses Blue-fastest ordering: B varies fastest, then G, then R
+    # A C-ordered [r, g, b] array flattens to exactly that: for R, for G, for B
+    rows = lut.reshape(-1, 3)
+    for start in range(0, rows.shape[0], chunk_rows):
+        yield format_cube_rows(rows[start:start + chunk_rows])
+
 def lut_to_cube(lut: np.ndarray) -> str:
     """Convert 3D LUT array to .cube file format with correct coordinate ordering"""
-    size = lut.shape[0]
-    cube = f"# LUTForge AI Generated LUT v2.0\n"
-    cube += f"# Created using professional color-matcher algorithms\n"
-    cube += f"LUT_3D_SIZE {size}\n\n"
+    with span("cube"):
+        return "".join(iter_cube_chunks(lut))
 
-    # IMPORTANT: .cube format uses Blue-fastest ordering: B varies fastest, then G, then R
-    # This means the data should be written as: for R, for G, for B
-    for r in range(size):
-        for g in range(size):
-            for b in range(size):
-                # Access LUT with [r][g][b] indexing in the order R->G->B
-                rgb = lut[r, g, b]
-                cube += f"{rgb[0]:.6f} {rgb[1]:.6f} {rgb[2]:.6f}\n"
-
-    return cube
-
-def analyze_lut_content(lut_content: str) -> dict:
-    """Analyze LUT content to check for actual transformations"""
-    lines = lut_content.split('\n')
-    data_lines = [line.strip() for line in lines if line.strip() and not line.startswith('#') and not line.startswith('LUT_3D_SIZE')]
-    
-    transformations = 0
-    identity_count = 0
-    max_change = 0.0
-    
-    for i, line in enumerate(data_lines):
-        if line:
-            values = [float(x) for x in line.split()]
-            if len(values) == 3:
-                # Calculate expected identity values for this position
-                size = int(round(len(data_lines) ** (1/3)))
-                b = i // (size * size)
-                g = (i % (size * size)) // size
-                r = i % size
-                
-                expected_r = r / (size - 1)
-                expected_g = g / (size - 1)
-                expected_b = b / (size - 1)
-                
-                # Check if this is an identity transformation
-                r_diff = abs(values[0] - expected_r)
-                g_diff = abs(values[1] - expected_g)
-                b_diff = abs(values[2] - expected_b)
-                
-                max_diff = max(r_diff, g_diff, b_diff)
-                max_change = max(max_change, max_diff)
-                
-                if max_diff > 0.01:  # Significant change threshold
-                    transformations += 1
-                else:
-                    identity_count += 1
+def analyze_lut_array(lut: np.ndarray) -> dict:
+    """Analyze a (size, size, size, 3) LUT array for its deviation from identity and its gamut"""
+    size = lut.shape[0]
+    delta = np.abs(lut - create_identity_lattice(size))
+    max_diff = delta.max(axis=-1)
+    total_entries = max_diff.size
+    
+    # Significant change threshold for counting an entry as transformed
+    transformations = int(np.count_nonzero(max_diff > 0.01))
+    out_of_gamut = int(np.count_nonzero(np.any((lut < 0) | (lut > 1), axis=-1)))
     
     return {
-        "total_entries": len(data_lines),
+        "lut_size": size,
+        "total_entries": total_entries,
         "transformations": transformations,
-        "identity_count": identity_count,
-        "max_change": max_change,
-        "transformation_percentage": (transformations / len(data_lines)) * 100 if data_lines else 0
+        "identity_count": total_entries - transformations,
+        "max_change": float(max_diff.max()),
+        "mean_change": float(delta.mean()),
+        "transformation_percentage": (transformations / total_entries) * 100,
+        "out_of_gamut_count": out_of_gamut,
+        "out_of_gamut_percentage": (out_of_gamut / total_entries) * 100
     }
 
+def analyze_lut_content(lut_content: str, filename: str = "") -> dict:
+    """Analyze .cube, .3dl or .lut content to check for actual transformations"""
+    lut = read_lut(lut_content, filename)
+    if lut.lut_3d is None:
+        raise ValueError("Only 3D LUTs can be analyzed")
+    return analyze_lut_array(lut.lut_3d)
+
+def content_hash(image_data: bytes) -> str:
+    """Return the content address (SHA-256 hex digest) of uploaded bytes"""
+    return hashlib.sha256(image_data).hexdigest()
+
+def decode_source_image(image_data: bytes, max_size: int = 512, draft: bool = False) -> np.ndarray:
+    """Decode uploaded image bytes into a float32 RGB array no larger than max_size
+    
+    draft lets JPEG decoding downscale in the DCT domain, much faster for small thumbnails.
+    """
+    # Convert to PIL Image and then numpy array
+    pil_img = Image.open(io.BytesIO(image_data))
+    if draft:
+        pil_img.draft('RGB', (max_size, max_size))
+    if pil_img.mode != 'RGB':
+        pil_img = pil_img.convert('RGB')
+    
+    # Resize for processing (maintain aspect ratio)
+    pil_img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    return np.array(pil_img, dtype=np.float32) / 255.0
+
+def compute_image_fingerprint(image_data: bytes) -> tuple:
+    """Perceptual fingerprint of an upload, taken from a fast 64px thumbnail"""
+    return image_fingerprint(decode_source_image(image_data, max_size=64, draft=True))
+
+def build_lut_array(
+    image_data: bytes,
+    look_key: str,
+    method: str,
+    size: int = LUT_SIZE,
+    max_size: int = 512,
+    draft: bool = False
+) -> np.ndarray:
+    """Run the CPU-bound part of LUT generation for an upload and return the 3D LUT array
+    
+    Top-level and picklable so it can run in the LUT worker pool. max_size and draft are
+    passed to decode_source_image.
+    """
+    with span("decode"):
+        source_img = decode_source_image(image_data, max_size, draft)
+    
+    # Get selected cinematic look
+    look = CINEMATIC_LOOKS[look_key]
+    
+    # Get the (memoized) reference image and statistics for the cinematic look
+    with span("reference"):
+        if REFERENCE_CANONICAL_SIZE:
+            reference_img = get_reference_image(look_key, REFERENCE_CANONICAL_SIZE)
+            reference_analysis = get_reference_analysis(look_key)
+        else:
+            reference_img = get_reference_image(look_key, source_img.shape[:2])
+            reference_analysis = analyze_reference_colors(reference_img)
+    
+    # Generate LUT using color transfer
+    lut_array = generate_lut_from_color_transfer(
+        source_img, 
+        reference_img, 
+        method,
+        reference_analysis,
+        size
+    )
+    
+    # Apply cinematic adjustments
+    return apply_cinematic_adjustments(lut_array, look)
+
+def build_lut_cube(image_data: bytes, look_key: str, method: str, size: int = LUT_SIZE, *decode_args) -> str:
+    """Run build_lut_array and convert the result to .cube content in the same worker"""
+    return lut_to_cube(build_lut_array(image_data, look_key, method, size, *decode_args))
+
+def build_lut_array_and_cube(image_data: bytes, look_key: str, method: str, size: int = LUT_SIZE) -> tuple:
+    """Run build_lut_array and return (lut_array, .cube content), both built in the worker"""
+    lut_array = build_lut_array(image_data, look_key, method, size)
+    return lut_array, lut_to_cube(lut_array)
+
+def stream_cube(lut_array: np.ndarray, cache_key: str):
+    """Stream a LUT as .cube chunks, caching the complete file once it has been sent"""
+    chunks = []
+    for chunk in iter_cube_chunks(lut_array):
+        chunks.append(chunk)
+        yield chunk
+    lut_cache.set(cache_key, "".join(chunks))
+
+class ZipChunkSink:
+    """Write-only file object that collects what zipfile writes, so a zip can be streamed
+    
+    It has no tell/seek, so zipfile tracks offsets itself and writes data descriptors.
+    """
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        """Return and forget everything written since the last drain"""
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def cube_file_response(content) -> StreamingResponse:
+    """Plain-text .cube download response for a string or an iterator of chunks"""
+    return StreamingResponse(
+        iter([content]) if isinstance(content, str) else content,
+        media_type="text/plain",
+        headers={"Content-Disposition": 'attachment; filename="lutforge.cube"'}
+    )
+
+def check_lut_capacity():
+    """Reject a request with a 503 when the LUT worker pool and its queue are full"""
+    if lut_jobs_in_flight >= max(LUT_WORKERS, 1) + LUT_MAX_QUEUED_JOBS:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy generating other LUTs. Please retry shortly.",
+            headers={"Retry-After": "1"}
+        )
+
+def start_lut_executor() -> ProcessPoolExecutor:
+    """Start the LUT worker pool"""
+    # Spawned (not forked) workers, so they don't inherit the gRPC state of the Gemini client
+    return ProcessPoolExecutor(
+        max_workers=LUT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_lut_worker,
+        initargs=(lut_fallback_count,)
+    )
+
+def restart_lut_executor(broken: ProcessPoolExecutor):
+    """Replace a broken LUT worker pool, once however many of its jobs failed"""
+    global lut_executor
+    if lut_executor is broken:
+        lut_executor = start_lut_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+async def run_lut_job(func: Callable, *args):
+    """Run a CPU-bound job on the LUT worker pool, rejecting it with a 503 when saturated
+    
+    A worker that dies (out of memory, a crash in native code) breaks the whole pool: it is
+    replaced for later jobs and the failed job is answered with a 503 too.
+    """
+    global lut_jobs_in_flight
+    check_lut_capacity()
+    
+    lut_jobs_in_flight += 1
+    executor = lut_executor
+    try:
+        loop = asyncio.get_running_loop()
+        timings = current_timings()
+        with span("lut_job"):
+            if timings is None:
+                return await loop.run_in_executor(executor, func, *args)
+            # The job's own spans come back from the worker alongside its result
+            result, durations = await loop.run_in_executor(executor, run_timed, func, *args)
+        timings.merge(durations)
+        return result
+    except BrokenProcessPool:
+        restart_lut_executor(executor)
+        raise HTTPException(
+            status_code=503,
+            detail="A LUT worker stopped unexpectedly. Please retry shortly.",
+            headers={"Retry-After": "1"}
+        )
+    finally:
+        lut_jobs_in_flight -= 1
+
+def grade_image_bytes(image_data: bytes, lut: LutFile, interpolation: str, output_format: str) -> bytes:
+    """Decode a full-resolution upload, apply a LUT and encode the graded image"""
+    with span("decode"):
+        pil_img = Image.open(io.BytesIO(image_data))
+        if pil_img.mode != 'RGB':
+            pil_img = pil_img.convert('RGB')
+        
+        # Grade in place so only one full-size copy of the pixels is held
+        image = np.array(pil_img)
+        del pil_img
+    with span("apply_lut"):
+        graded = apply_lut(
+            image, lut, interpolation,
+            out=image,
+            memory_budget=LUT_APPLY_MEMORY_BUDGET,
+            scheduler=image_scheduler
+        )
+    
+    pil_format, _, options = OUTPUT_FORMATS[output_format]
+    buffer = io.BytesIO()
+    with span("encode"):
+        Image.fromarray(graded).save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+def lut_cache_key(image_hash: str, analysis_result: ColorMatcherResponse, size: int = LUT_SIZE) -> str:
+    """Cache key of the LUT generated for an upload analyzed to a look, at a lattice size"""
+    return f"{image_hash}-{analysis_result.cinematic_look}-{analysis_result.method}-{size}"
+
+def check_lut_size(size: int):
+    """Reject lattice sizes outside LUT_SIZES with a 400"""
+    if size not in LUT_SIZES:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid LUT size. Expected one of: {', '.join(map(str, LUT_SIZES))}")
+
+async def generate_cube(image_data: bytes, image_hash: str, analysis_result: ColorMatcherResponse, size: int = LUT_SIZE) -> str:
+    """Return the .cube content for an analyzed upload, from the cache or a LUT worker"""
+    lut_key = lut_cache_key(image_hash, analysis_result, size)
+    cube_content = await lut_cache.get_async(lut_key)
+    if cube_content is None:
+        cube_content = await run_lut_job(
+            build_lut_cube,
+            image_data,
+            analysis_result.cinematic_look,
+            analysis_result.method,
+            size
+        )
+        lut_cache.set(lut_key, cube_content)
+    return cube_content
+
+def shoot_image_statistics(image_data: bytes) -> dict:
+    """Decode one image of a shoot and return its image_statistics sums"""
+    with span("decode"):
+        source_img = decode_source_image(image_data)
+    with span("statistics"):
+        return image_statistics(source_img)
+
+def build_shoot_lut_cube(shoot_statistics: dict, look_key: str, size: int = LUT_SIZE) -> str:
+    """Build one .cube for a whole shoot from its summed image statistics"""
+    if REFERENCE_CANONICAL_SIZE:
+        reference_analysis = get_reference_analysis(look_key)
+    else:
+        reference_analysis = analyze_reference_colors(get_reference_image(look_key, (512, 512)))
+    
+    try:
+        with span("grading"):
+            lut_array = apply_professional_color_grading_lattice(
+                create_identity_lattice(size),
+                characteristics_from_statistics(shoot_statistics),
+                reference_analysis
+            )
+    except Exception:
+        # Same fallback as generate_lut_from_color_transfer
+        count_lut_fallback()
+        with span("adaptive_lut"):
+            lut_array = create_adaptive_lut(reference_analysis, size)
+    
+    return lut_to_cube(apply_cinematic_adjustments(lut_array, CINEMATIC_LOOKS[look_key]))
+
+def server_sent_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event with a single-line JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def progressive_lut_events(image_data: bytes, image_hash: str, size: int):
+    """Yield a preview LUT as soon as it is built, then the full LUT once analysis completes
+    
+    Events are "preview" and "lut" with the .cube content, or "error" with a detail.
+    """
+    analysis_task = asyncio.ensure_future(analyze_image_for_cinematic_look(image_data, image_hash))
+    try:
+        # A cached analysis completes without suspending, so one scheduling round tells whether
+        # the preview can already use the final look
+        await asyncio.sleep(0)
+        if analysis_task.done() and not analysis_task.exception():
+            preview_look, preview_method = analysis_task.result().cinematic_look, analysis_task.result().method
+        else:
+            preview_look, preview_method = PREVIEW_LOOK, "mkl"
+        
+        # A small job, but still run on the pool: decoding a large PNG or TIFF is not cheap,
+        # and the pool's queue limit applies to previews too
+        preview_cube = await run_lut_job(
+            build_lut_cube,
+            image_data,
+            preview_look,
+            preview_method,
+            PREVIEW_LUT_SIZE,
+            PREVIEW_MAX_SIZE,
+            True
+        )
+        yield server_sent_event("preview", {
+            "size": PREVIEW_LUT_SIZE,
+            "cinematic_look": preview_look,
+            "cube": preview_cube
+        })
+        
+        analysis_result = await analysis_task
+        cube_content = await generate_cube(image_data, image_hash, analysis_result, size)
+        yield server_sent_event("lut", {
+            "size": size,
+            "analysis": analysis_result.model_dump(),
+            "cube": cube_content
+        })
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        yield server_sent_event("error", {"detail": f"LUT generation failed: {detail}"})
+    finally:
+        analysis_task.cancel()
+
+async def get_generated_lut(image_data: bytes, size: int = LUT_SIZE) -> LutFile:
+    """Generate (or fetch from the cache) the LUT /api/generate-lut would return for an upload"""
+    image_hash = content_hash(image_data)
+    analysis_result = await analyze_image_for_cinematic_look(image_data, image_hash)
+    
+    lut_key = lut_cache_key(image_hash, analysis_result, size)
+    cube_content = await lut_cache.get_async(lut_key)
+    if cube_content is not None:
+        return await asyncio.to_thread(read_cube, cube_content)
+    
+    # The .cube for the cache is formatted in the worker too: ~0.5 s at 129^3
+    lut_array, cube_content = await run_lut_job(
+        build_lut_array_and_cube,
+        image_data,
+        analysis_result.cinematic_look,
+        analysis_result.method,
+        size
+    )
+    lut_cache.set(lut_key, cube_content)
+    return LutFile(lut_3d=lut_array.astype(np.float32))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "message": "LUTForge AI Backend v2.0 is running"}
 
+@app.get("/api/metrics")
+async def metrics():
+    """Fallback-path hits, cache statistics and LUT jobs in flight"""
+    return {
+        "fallbacks": {
+            "lut": lut_fallback_count.value,
+            "analysis": analysis_fallback_count
+        },
+        "caches": {
+            "analysis": analysis_cache.stats(),
+            "lut": lut_cache.stats(),
+            "near_duplicate": near_duplicate_index.stats() if near_duplicate_index is not None else None
+        },
+        "lut_jobs_in_flight": lut_jobs_in_flight
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: request counts and latencies, stage and Gemini latency
+    histograms, fallback counts, in-flight requests and jobs, and cache statistics"""
+    return Response(metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.get("/test-color-matcher")
 async def test_color_matcher():
     """Test color-matcher library installation"""
@@ -782,48 +1614,78 @@ async def test_color_matcher():
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
+@app.post("/api/analyze-lut")
+async def analyze_lut(file: UploadFile = File(...)):
+    """Analyze a .cube/.3dl LUT for identity deviation, transformed entries and out-of-gamut values"""
+    try:
+        lut_content = (await file.read()).decode('utf-8')
+        return await asyncio.to_thread(analyze_lut_content, lut_content, file.filename or "")
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid LUT file: {str(e)}")
+
 @app.post("/api/generate-lut")
-async def generate_lut(file: UploadFile = File(...)):
-    """Generate LUT using professional color-matcher algorithms"""
+async def generate_lut(
+    file: UploadFile = File(...),
+    stream: bool = False,
+    size: int = LUT_SIZE,
+    progressive: bool = False
+):
+    """Generate LUT using professional color-matcher algorithms
+    
+    By default the .cube content is returned as a JSON string; stream=true streams the raw
+    .cube file as text/plain while it is being formatted. size picks the lattice size.
+    progressive=true returns Server-Sent Events: a 17^3 "preview" LUT within milliseconds,
+    then the full "lut" once the AI analysis is done (see progressive_lut_events).
+    """
     if not file.content_type.startswith('image/'):
         raise HTTPException(
             status_code=400, detail="Invalid file type. Please upload an image.")
+    check_lut_size(size)
 
     try:
         # Read image data
         image_data = await file.read()
         
-        # Convert to PIL Image and then numpy array
-        pil_img = Image.open(io.BytesIO(image_data))
-        if pil_img.mode != 'RGB':
-            pil_img = pil_img.convert('RGB')
+        image_hash = content_hash(image_data)
         
-        # Resize for processing (maintain aspect ratio)
-        max_size = 512
-        pil_img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-        source_img = np.array(pil_img, dtype=np.float32) / 255.0
+        if progressive:
+            # Once the stream has started a busy pool can only be reported as an "error" event,
+            # so a saturated pool is refused with a 503 up front
+            check_lut_capacity()
+            return StreamingResponse(
+                progressive_lut_events(image_data, image_hash, size),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
-        # AI analysis for cinematic look selection
-        analysis_result = await analyze_image_for_cinematic_look(image_data)
+        # AI analysis for cinematic look selection (cached for duplicate uploads)
+        analysis_result = await analyze_image_for_cinematic_look(image_data, image_hash)
         
-        # Get selected cinematic look
-        look = CINEMATIC_LOOKS[analysis_result.cinematic_look]
+        # Duplicate uploads analyzed to the same look reuse the generated LUT
+        lut_key = lut_cache_key(image_hash, analysis_result, size)
+        cube_content = await lut_cache.get_async(lut_key)
+        if cube_content is not None:
+            return cube_file_response(cube_content) if stream else cube_content
         
-        # Create reference image based on cinematic look
-        reference_img = create_reference_image(look, source_img.shape[:2])
+        if stream:
+            lut_array = await run_lut_job(
+                build_lut_array,
+                image_data,
+                analysis_result.cinematic_look,
+                analysis_result.method,
+                size
+            )
+            return cube_file_response(stream_cube(lut_array, lut_key))
         
-        # Generate LUT using color transfer
-        lut_array = generate_lut_from_color_transfer(
-            source_img, 
-            reference_img, 
-            analysis_result.method
+        # Decode, color transfer and LUT construction run off the event loop
+        cube_content = await run_lut_job(
+            build_lut_cube,
+            image_data,
+            analysis_result.cinematic_look,
+            analysis_result.method,
+            size
         )
-        
-        # Apply cinematic adjustments
-        lut_array = apply_cinematic_adjustments(lut_array, look)
-        
-        # Convert to cube format
-        cube_content = lut_to_cube(lut_array)
+        lut_cache.set(lut_key, cube_content)
         
         return cube_content
 
@@ -833,6 +1695,188 @@ async def generate_lut(file: UploadFile = File(...)):
         raise HTTPException(
             status_code=500, detail=f"LUT generation failed: {str(e)}")
 
+@app.post("/api/generate-luts")
+async def generate_luts(files: List[UploadFile] = File(...), size: int = LUT_SIZE):
+    """Generate a LUT for every uploaded image and stream them back as a zip of .cube files
+    
+    Identical uploads are generated once, Gemini analyses run concurrently (capped by
+    GEMINI_MAX_CONCURRENCY) and at most one LUT job per worker is queued for the batch.
+    manifest.json in the zip lists the look chosen for each image, or why it failed.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400, detail=f"Too many files. Upload at most {BATCH_MAX_FILES} images per batch.")
+    for file in files:
+        if not file.content_type.startswith('image/'):
+            raise HTTPException(
+                status_code=400, detail=f"Invalid file type for {file.filename}. Please upload images only.")
+    check_lut_size(size)
+    
+    uploads = []
+    for file in files:
+        image_data = await file.read()
+        uploads.append((file.filename, content_hash(image_data), image_data))
+    
+    # Queue batch jobs one worker's worth at a time, so a large batch doesn't hit the 503 limit
+    lut_slots = asyncio.Semaphore(max(LUT_WORKERS, 1))
+    
+    async def generate_one(image_hash: str, image_data: bytes) -> tuple:
+        analysis_result = await analyze_image_for_cinematic_look(image_data, image_hash)
+        async with lut_slots:
+            return analysis_result, await generate_cube(image_data, image_hash, analysis_result, size)
+    
+    # Start every unique upload now; entries are written in upload order as they finish
+    tasks = {}
+    for _, image_hash, image_data in uploads:
+        if image_hash not in tasks:
+            tasks[image_hash] = asyncio.ensure_future(generate_one(image_hash, image_data))
+    
+    async def stream_zip():
+        sink = ZipChunkSink()
+        manifest = []
+        used_names = set()
+        try:
+            with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for index, (filename, image_hash, _) in enumerate(uploads):
+                    stem = os.path.splitext(os.path.basename(filename or ""))[0] or f"image-{index + 1}"
+                    cube_name = f"{stem}.cube"
+                    suffix = 2
+                    while cube_name in used_names:
+                        cube_name = f"{stem}-{suffix}.cube"
+                        suffix += 1
+                    used_names.add(cube_name)
+                    
+                    try:
+                        analysis_result, cube_content = await tasks[image_hash]
+                    except Exception as e:
+                        detail = e.detail if isinstance(e, HTTPException) else str(e)
+                        manifest.append({"file": filename, "error": f"LUT generation failed: {detail}"})
+                        continue
+                    
+                    await asyncio.to_thread(archive.writestr, cube_name, cube_content)
+                    manifest.append({
+                        "file": filename,
+                        "lut": cube_name,
+                        "cinematic_look": analysis_result.cinematic_look,
+                        "method": analysis_result.method,
+                        "confidence": analysis_result.confidence
+                    })
+                    yield sink.drain()
+                
+                archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+            yield sink.drain()
+        finally:
+            # The client may disconnect mid-stream; don't leave its jobs running
+            for task in tasks.values():
+                task.cancel()
+    
+    return StreamingResponse(
+        stream_zip(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="lutforge-luts.zip"'}
+    )
+
+@app.post("/api/generate-shoot-lut")
+async def generate_shoot_lut(
+    files: List[UploadFile] = File(...),
+    look: str = None,
+    stream: bool = False,
+    size: int = LUT_SIZE
+):
+    """Generate one consistent LUT for a set of images from the same scene
+    
+    Images are decoded one worker's worth at a time and their statistics added to running
+    sums, so memory does not grow with the batch. The look is the given one, or the one Gemini
+    picks for the first image. Returns the .cube like /api/generate-lut.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400, detail=f"Too many files. Upload at most {BATCH_MAX_FILES} images per batch.")
+    for file in files:
+        if not file.content_type.startswith('image/'):
+            raise HTTPException(
+                status_code=400, detail=f"Invalid file type for {file.filename}. Please upload images only.")
+    if look is not None and look not in CINEMATIC_LOOKS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid look. Expected one of: {', '.join(CINEMATIC_LOOKS)}")
+    check_lut_size(size)
+
+    try:
+        shoot_statistics = None
+        shoot_hash = hashlib.sha256()
+        window = max(LUT_WORKERS, 1)
+        for start in range(0, len(files), window):
+            images = [await file.read() for file in files[start:start + window]]
+            if look is None:
+                # AI analysis of the first image picks the look for the whole shoot
+                look = (await analyze_image_for_cinematic_look(images[0], content_hash(images[0]))).cinematic_look
+            for image_data in images:
+                shoot_hash.update(content_hash(image_data).encode())
+            
+            # Decoding and statistics run off the event loop, then fold into the running sums
+            for stats in await asyncio.gather(*(run_lut_job(shoot_image_statistics, image_data) for image_data in images)):
+                shoot_statistics = stats if shoot_statistics is None else sum_partials([shoot_statistics, stats])
+        
+        # The same set of images graded to the same look reuses the LUT
+        lut_key = f"shoot-{shoot_hash.hexdigest()}-{look}-{size}"
+        cube_content = await lut_cache.get_async(lut_key)
+        if cube_content is None:
+            cube_content = await run_lut_job(build_shoot_lut_cube, shoot_statistics, look, size)
+            lut_cache.set(lut_key, cube_content)
+        
+        return cube_file_response(cube_content) if stream else cube_content
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Shoot LUT generation failed: {str(e)}")
+
+@app.post("/api/apply-lut")
+async def grade_image(
+    file: UploadFile = File(...),
+    lut: UploadFile = File(None),
+    interpolation: str = "tetrahedral",
+    output_format: str = "jpeg",
+    size: int = LUT_SIZE
+):
+    """Apply a LUT to a full-resolution image and return the graded image
+    
+    Uses the uploaded .cube/.3dl LUT if one is given, otherwise generates one for the image.
+    """
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(
+            status_code=400, detail="Invalid file type. Please upload an image.")
+    if interpolation not in INTERPOLATIONS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid interpolation. Expected one of: {', '.join(INTERPOLATIONS)}")
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid output format. Expected one of: {', '.join(OUTPUT_FORMATS)}")
+    check_lut_size(size)
+
+    try:
+        image_data = await file.read()
+        
+        if lut is not None:
+            try:
+                lut_content = (await lut.read()).decode('utf-8')
+                lut_file = await asyncio.to_thread(read_lut, lut_content, lut.filename or "")
+            except (UnicodeDecodeError, ValueError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid LUT file: {str(e)}")
+        else:
+            lut_file = await get_generated_lut(image_data, size)
+        
+        # Full-resolution decode, interpolation and encode run off the event loop
+        graded = await run_lut_job(grade_image_bytes, image_data, lut_file, interpolation, output_format)
+        return Response(content=graded, media_type=OUTPUT_FORMATS[output_format][1])
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"LUT application failed: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,96 @@
+import time
+import threading
+from typing import Any, Optional
+
+import cv2
+import numpy as np
+
+HISTOGRAM_BINS = 4  # per channel, 4x4x4 = 64 RGB bins
+
+
+def image_fingerprint(img: np.ndarray) -> tuple:
+    """Compute a perceptual fingerprint of a float32 RGB thumbnail in [0,1]
+
+    Returns (dct_hash, histogram): a 64-bit DCT hash of the luminance structure, which survives
+    re-encoding and resizing, and a normalized coarse RGB histogram to tell apart images with
+    the same structure but different colors.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+
+    # Low-frequency 8x8 DCT block, thresholded at its median (DC term excluded from the median)
+    low_freq = cv2.dct(small)[:8, :8].flatten()
+    bits = low_freq > np.median(low_freq[1:])
+    dct_hash = int(np.packbits(bits).view(">u8")[0])
+
+    # Coarse color distribution
+    bins = np.minimum((img * HISTOGRAM_BINS).astype(np.int64), HISTOGRAM_BINS - 1)
+    bin_index = (bins[:, :, 0] * HISTOGRAM_BINS + bins[:, :, 1]) * HISTOGRAM_BINS + bins[:, :, 2]
+    histogram = np.bincount(bin_index.ravel(), minlength=HISTOGRAM_BINS ** 3).astype(np.float32)
+    histogram /= max(histogram.sum(), 1)
+
+    return dct_hash, histogram
+
+
+class PerceptualIndex:
+    """Nearest-neighbour index over the fingerprints of recently analyzed images
+
+    A bounded ring buffer: the oldest entry is overwritten once max_entries is reached, and
+    entries older than ttl seconds never match. A lookup matches the entry with the smallest
+    DCT hash Hamming distance, provided it is within max_distance bits and the histograms'
+    L1 distance is within max_histogram_distance.
+    """
+
+    def __init__(self, max_entries: int, max_distance: int, max_histogram_distance: float, ttl: float):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.max_histogram_distance = max_histogram_distance
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._hashes = np.zeros(max_entries, dtype=np.uint64)
+        self._histograms = np.zeros((max_entries, HISTOGRAM_BINS ** 3), dtype=np.float32)
+        self._added_at = np.full(max_entries, -np.inf)
+        self._values = [None] * max_entries
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def add(self, fingerprint: tuple, value: Any):
+        """Index value under an image fingerprint"""
+        dct_hash, histogram = fingerprint
+        with self._lock:
+            slot = self._next
+            self._hashes[slot] = dct_hash
+            self._histograms[slot] = histogram
+            self._added_at[slot] = time.time()
+            self._values[slot] = value
+            self._next = (slot + 1) % self.max_entries
+
+    def nearest(self, fingerprint: tuple) -> Optional[Any]:
+        """Return the value of the closest near-duplicate, or None if nothing is close enough"""
+        dct_hash, histogram = fingerprint
+        with self._lock:
+            distances = np.bitwise_count(self._hashes ^ np.uint64(dct_hash)).astype(np.int64)
+            histogram_distances = np.abs(self._histograms - histogram).sum(axis=1)
+            candidates = (
+                (self._added_at > time.time() - self.ttl)
+                & (distances <= self.max_distance)
+                & (histogram_distances <= self.max_histogram_distance)
+            )
+            if not np.any(candidates):
+                self.misses += 1
+                return None
+            self.hits += 1
+            best = np.argmin(np.where(candidates, distances, np.iinfo(np.int64).max))
+            return self._values[best]
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the number of live entries"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": int(np.count_nonzero(self._added_at > time.time() - self.ttl)),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
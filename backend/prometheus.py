@@ -0,0 +1,136 @@
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Optional, Sequence
+
+# Prometheus client defaults, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric family with fixed label names, rendered in the Prometheus text format
+
+    function, when given, is called at scrape time and returns {label values tuple: value};
+    use it to export numbers another component already keeps (cache stats, shared counters).
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), function: Optional[Callable[[], dict]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> list:
+        """Return (suffix, labels, value) samples"""
+        values = self.function() if self.function else self._snapshot()
+        return [("", dict(zip(self.labelnames, key)), value) for key, value in values.items()]
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram of observed values (durations in seconds)"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (not cumulative), then the sum
+                series = self._values[key] = [[0] * len(self.buckets), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def samples(self) -> list:
+        with self._lock:
+            snapshot = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        samples = []
+        for key, (counts, total) in snapshot.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    """Collection of metrics rendered together for a /metrics scrape"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
@@ -0,0 +1,183 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+# Fraction of max_entries left on disk after a prune, so full directory scans stay infrequent
+DISK_PRUNE_TARGET = 0.9
+
+
+class ResultCache:
+    """Size-bounded LRU cache with a TTL and an optional on-disk backend
+
+    Values must be JSON-serializable when a directory is given. Memory entries are
+    checked first; disk entries survive restarts and are shared between worker processes.
+    Disk writes happen on a background writer thread, and async code reads through
+    get_async so the event loop never waits on file I/O.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float, directory: Optional[str] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = os.path.join(directory, name) if directory else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._writer = None
+        # Estimated number of files on disk; the directory is only scanned when it exceeds
+        # max_entries
+        self._disk_entries = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._disk_entries = sum(1 for filename in os.listdir(self.directory) if filename.endswith(".json"))
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for key, or None if it is missing or expired"""
+        value = self._get_from_memory(key)
+        if value is not None or not self.directory:
+            return self._count_lookup(key, value, from_disk=False)
+        return self._count_lookup(key, self._read_from_disk(key), from_disk=True)
+
+    async def get_async(self, key: str) -> Any:
+        """get for async code: memory hits return directly, disk reads run on a thread"""
+        value = self._get_from_memory(key)
+        if value is not None or not self.directory:
+            return self._count_lookup(key, value, from_disk=False)
+        return self._count_lookup(key, await asyncio.to_thread(self._read_from_disk, key), from_disk=True)
+
+    def set(self, key: str, value: Any):
+        """Cache value under key, evicting the least recently used entries beyond max_entries
+        
+        The disk copy is written later by the writer thread.
+        """
+        with self._lock:
+            self._store(key, value, time.time() + self.ttl)
+            if self.directory:
+                if self._writer is None:
+                    self._writer = threading.Thread(
+                        target=self._write_loop, name=f"{self.name}-cache-writer", daemon=True
+                    )
+                    self._writer.start()
+                self._writes.put((key, value))
+
+    def flush(self):
+        """Wait until every pending disk write has been done"""
+        if self._writer is not None:
+            self._writes.join()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current number of memory entries"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+    def _get_from_memory(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+            return None
+
+    def _count_lookup(self, key: str, value: Any, from_disk: bool) -> Any:
+        """Count a lookup as a hit or a miss, keeping values read from disk in memory"""
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if from_disk:
+                self._store(key, value, time.time() + self.ttl)
+        return value
+
+    def _store(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_from_disk(self, key: str) -> Any:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            # The file's mtime is its last use, so expiry and eviction both go by it
+            if os.path.getmtime(path) + self.ttl <= time.time():
+                os.remove(path)
+                return None
+            with open(path, "r") as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _write_loop(self):
+        while True:
+            key, value = self._writes.get()
+            try:
+                self._write_to_disk(key, value)
+            finally:
+                self._writes.task_done()
+
+    def _write_to_disk(self, key: str, value: Any):
+        path = self._path(key)
+        try:
+            is_new = not os.path.exists(path)
+            # Write to a temporary file first so readers never see a partial entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+            if is_new:
+                self._disk_entries += 1
+            if self._disk_entries > self.max_entries:
+                self._prune_disk()
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def _prune_disk(self):
+        """Remove the least recently used files beyond DISK_PRUNE_TARGET of max_entries"""
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                path = os.path.join(self.directory, filename)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        # Other processes sharing the directory write files too, so the scan recounts
+        keep = int(self.max_entries * DISK_PRUNE_TARGET)
+        self._disk_entries = len(entries)
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - keep]:
+            try:
+                os.remove(path)
+                self._disk_entries -= 1
+            except OSError:
+                pass
@@ -0,0 +1,151 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+# Timings of the request being handled, or None when timing is off or outside a request
+_current_timings = contextvars.ContextVar("stage_timings", default=None)
+
+# Shared no-op returned by span() when nothing is being timed
+_NO_SPAN = nullcontext()
+
+
+class StageTimings:
+    """Wall-clock seconds spent per named pipeline stage during one request
+
+    Spans with the same name (e.g. one per image of a batch) add up. Thread-safe, so stages
+    running in asyncio.to_thread (which copies the context) report to the same request.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def merge(self, durations: dict):
+        """Add durations recorded elsewhere, e.g. in a LUT worker process"""
+        for name, seconds in durations.items():
+            self.add(name, seconds)
+
+    def server_timing(self, total: float) -> str:
+        """Format the stages and the total as a Server-Timing header value (milliseconds)"""
+        with self._lock:
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+def current_timings() -> Optional[StageTimings]:
+    return _current_timings.get()
+
+
+@contextmanager
+def _timed(timings: StageTimings, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def span(name: str):
+    """Context manager timing a pipeline stage of the current request
+
+    A shared no-op when the request is not being timed, so spans cost a context variable
+    lookup when timing is disabled.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        return _NO_SPAN
+    return _timed(timings, name)
+
+
+def run_timed(func: Callable, *args) -> tuple:
+    """Call func(*args) with its own timings and return (result, durations)
+
+    Top-level and picklable for executor jobs: worker processes and executor threads don't
+    see the request's context, so their spans are sent back and merged by the caller.
+    """
+    timings = StageTimings()
+    token = _current_timings.set(timings)
+    try:
+        return func(*args), timings.durations
+    finally:
+        _current_timings.reset(token)
+
+
+class StageTimingMiddleware:
+    """ASGI middleware timing each HTTP request and, with stages, its stages (see span)
+
+    on_start(scope) is called as a request comes in. With server_timing, the stages finished
+    when the response starts go out in a Server-Timing header. Once the body has been sent,
+    on_complete(scope, status, total, durations) is called with every stage, including those
+    that ran while a streamed body was being produced, and one JSON line is logged at INFO on
+    logger if one is given. Without stages, spans are no-ops and durations is empty.
+    """
+
+    def __init__(
+        self,
+        app,
+        server_timing: bool = True,
+        logger: Optional[logging.Logger] = None,
+        on_start: Optional[Callable] = None,
+        on_complete: Optional[Callable] = None,
+        stages: bool = True
+    ):
+        self.app = app
+        self.server_timing = server_timing
+        self.stages = stages
+        self.logger = logger
+        self.on_start = on_start
+        self.on_complete = on_complete
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = StageTimings() if self.stages else None
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        status = None
+        if self.on_start is not None:
+            self.on_start(scope)
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing and timings is not None:
+                    header = timings.server_timing(time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
+            total = time.perf_counter() - start
+            durations = timings.durations if timings is not None else {}
+            if self.on_complete is not None:
+                self.on_complete(scope, status, total, durations)
+            if self.logger is not None and self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(json.dumps({
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "total_ms": round(total * 1000, 1),
+                    "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in durations.items()}
+                }))
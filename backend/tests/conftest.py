@@ -0,0 +1,21 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# LUT jobs run on a thread instead of spawned worker processes, and nothing is shared on disk
+os.environ.setdefault("LUT_WORKERS", "0")
+os.environ.pop("RESULT_CACHE_DIR", None)
+
+
+@pytest.fixture
+def image_bytes():
+    """Return a function making a distinct random PNG upload per seed"""
+    def make(seed: int, size: tuple = (96, 128)) -> bytes:
+        rng = np.random.default_rng(seed)
+        buffer = io.BytesIO()
+        Image.fromarray((rng.random((*size, 3)) * 255).astype(np.uint8)).save(buffer, format="PNG")
+        return buffer.getvalue()
+    return make
@@ -0,0 +1,108 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import main
+from perceptual_index import image_fingerprint
+
+
+class UnknownLookModel:
+    """Fake Gemini model answering with a look that is not in CINEMATIC_LOOKS"""
+
+    calls = 0
+
+    def __init__(self, model_name: str, *args, **kwargs):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, generation_config=None):
+        UnknownLookModel.calls += 1
+        return SimpleNamespace(text=(
+            '{"analysis": "fake", "cinematic_look": "teal_and_orange", "method": "mkl", "confidence": 0.9}'
+        ))
+
+
+def test_unknown_look_falls_back_and_is_not_cached(monkeypatch, image_bytes):
+    monkeypatch.setattr(main.genai, "GenerativeModel", UnknownLookModel)
+    UnknownLookModel.calls = 0
+    upload = image_bytes(8008)
+    image_hash = main.content_hash(upload)
+
+    for _ in range(2):
+        result = asyncio.run(main.analyze_image_for_cinematic_look(upload, image_hash))
+        assert result.cinematic_look == "warm_vintage"
+
+    # Neither the content-addressed cache nor the near-duplicate index kept the bad answer
+    assert main.analysis_cache.get(image_hash) is None
+    assert UnknownLookModel.calls == 2
+
+
+class FilmNoirModel:
+    """Fake Gemini model that always recommends film_noir, counting its calls"""
+
+    calls = 0
+
+    def __init__(self, model_name: str, *args, **kwargs):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, generation_config=None):
+        FilmNoirModel.calls += 1
+        return SimpleNamespace(text=(
+            '{"analysis": "fake", "cinematic_look": "film_noir", "method": "reinhard", "confidence": 0.9}'
+        ))
+
+
+def gradient_image(phase: float) -> np.ndarray:
+    """Smooth colorful 8-bit image whose structure depends on phase"""
+    y, x = np.mgrid[0:192, 0:256].astype(np.float32)
+    x /= 255
+    y /= 191
+    image = np.stack([
+        0.5 + 0.5 * np.sin(6 * x + 3 * y + phase),
+        x * y,
+        0.5 + 0.4 * np.cos(9 * x * y + phase),
+    ], axis=-1)
+    return (image * 255).astype(np.uint8)
+
+
+def encode(image: np.ndarray, format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def analyze(upload: bytes) -> main.ColorMatcherResponse:
+    return asyncio.run(main.analyze_image_for_cinematic_look(upload, main.content_hash(upload)))
+
+
+def test_reencoded_resized_copy_reuses_the_look(monkeypatch):
+    monkeypatch.setattr(main.genai, "GenerativeModel", FilmNoirModel)
+    FilmNoirModel.calls = 0
+    original = gradient_image(phase=0.0)
+    assert analyze(encode(original, "PNG")).cinematic_look == "film_noir"
+
+    # Half size and lossy: different bytes, same picture
+    copy = np.array(Image.fromarray(original).resize((128, 96), Image.Resampling.BILINEAR))
+    assert analyze(encode(copy, "JPEG", quality=75)).cinematic_look == "film_noir"
+    assert FilmNoirModel.calls == 1
+
+
+def test_same_structure_in_other_colors_is_not_a_near_duplicate(monkeypatch):
+    monkeypatch.setattr(main.genai, "GenerativeModel", FilmNoirModel)
+    FilmNoirModel.calls = 0
+    original = gradient_image(phase=1.0)
+    # Gray at the original's luminance: the same DCT hash, a very different color histogram
+    luminance = np.asarray(Image.fromarray(original).convert("L"))
+    gray = np.repeat(luminance[:, :, np.newaxis], 3, axis=2)
+
+    (original_hash, original_histogram), (gray_hash, gray_histogram) = (
+        image_fingerprint(image.astype(np.float32) / 255) for image in (original, gray)
+    )
+    assert bin(original_hash ^ gray_hash).count("1") <= main.near_duplicate_index.max_distance
+    assert np.abs(original_histogram - gray_histogram).sum() > main.near_duplicate_index.max_histogram_distance
+
+    analyze(encode(original, "PNG"))
+    analyze(encode(gray, "PNG"))
+    assert FilmNoirModel.calls == 2
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import main
+
+LOOKS = list(main.CINEMATIC_LOOKS)
+
+
+@pytest.fixture(scope="module")
+def source_analyses():
+    """Analyses of a warm and a cool source, so both temperature branches are exercised"""
+    return [
+        main.analyze_image_characteristics(main.create_reference_image(main.CINEMATIC_LOOKS[look_key], (96, 128), seed=1))
+        for look_key in ("warm_red_film", "cool_digital")
+    ]
+
+
+def grade_lattice_per_node(lattice: np.ndarray, source_analysis, reference_analysis) -> np.ndarray:
+    graded = np.empty_like(lattice)
+    for index in np.ndindex(lattice.shape[:3]):
+        graded[index] = main.apply_professional_color_grading(lattice[index], source_analysis, reference_analysis)
+    return graded
+
+
+@pytest.mark.parametrize("size", [9, 17])
+@pytest.mark.parametrize("look_key", LOOKS)
+def test_grading_lattice_matches_scalar(source_analyses, look_key, size):
+    reference_analysis = main.get_reference_analysis(look_key)
+    lattice = main.create_identity_lattice(size)
+    for source_analysis in source_analyses:
+        expected = grade_lattice_per_node(lattice, source_analysis, reference_analysis)
+        actual = main.apply_professional_color_grading_lattice(lattice, source_analysis, reference_analysis)
+        assert np.array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("size", [9, 17, 33])
+@pytest.mark.parametrize("look_key", LOOKS)
+def test_adaptive_lut_matches_scalar(look_key, size):
+    reference_analysis = main.get_reference_analysis(look_key)
+    assert np.array_equal(
+        main.create_adaptive_lut(reference_analysis, size),
+        main.create_adaptive_lut_scalar(reference_analysis, size)
+    )
@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+import main
+
+GEMINI_DELAY = 1.0
+
+
+class SlowGenerativeModel:
+    """Fake Gemini model that sleeps before answering, signalling when a call starts and ends"""
+
+    started = None
+    finished = False
+
+    def __init__(self, model_name: str, *args, **kwargs):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, generation_config=None):
+        SlowGenerativeModel.started.set()
+        await asyncio.sleep(GEMINI_DELAY)
+        SlowGenerativeModel.finished = True
+        return SimpleNamespace(text=(
+            '{"analysis": "fake", "cinematic_look": "orange_teal", "method": "mkl", "confidence": 0.9}'
+        ))
+
+
+def test_other_requests_complete_while_gemini_is_pending(monkeypatch, image_bytes):
+    monkeypatch.setattr(main.genai, "GenerativeModel", SlowGenerativeModel)
+    upload = image_bytes(6006)
+
+    async def scenario():
+        SlowGenerativeModel.started = asyncio.Event()
+        SlowGenerativeModel.finished = False
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            generate = asyncio.create_task(
+                client.post("/api/generate-lut", files={"file": ("upload.png", upload, "image/png")})
+            )
+            await asyncio.wait_for(SlowGenerativeModel.started.wait(), timeout=10)
+
+            health = await asyncio.wait_for(client.get("/health"), timeout=GEMINI_DELAY / 2)
+            assert health.status_code == 200
+            # Served while the upload was still waiting on Gemini
+            assert not SlowGenerativeModel.finished
+            assert not generate.done()
+
+            response = await asyncio.wait_for(generate, timeout=60)
+        assert response.status_code == 200
+        assert "LUT_3D_SIZE 33" in response.json()
+
+    asyncio.run(scenario())
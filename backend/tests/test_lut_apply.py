@@ -0,0 +1,49 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import main
+from lut_apply import COLOR_TABLE_BYTES, COLOR_TABLE_MIN_PIXELS, INTERPOLATIONS, apply_lut
+from lut_io import LutFile
+
+
+@pytest.fixture(scope="module")
+def lut():
+    return LutFile(lut_3d=main.apply_cinematic_adjustments(
+        main.create_identity_lattice(17), main.CINEMATIC_LOOKS["orange_teal"]
+    ).astype(np.float32))
+
+
+@pytest.fixture(scope="module")
+def large_image():
+    # Just over the color-table threshold, with varied colors
+    width = 1024
+    rng = np.random.default_rng(14)
+    return rng.integers(0, 256, (COLOR_TABLE_MIN_PIXELS // width + 1, width, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("interpolation", INTERPOLATIONS)
+def test_color_table_matches_per_pixel_grading(lut, large_image, interpolation):
+    # A budget too small for the color table grades every pixel directly
+    per_pixel = apply_lut(large_image, lut, interpolation, memory_budget=COLOR_TABLE_BYTES)
+    color_table = apply_lut(large_image, lut, interpolation, memory_budget=2 * COLOR_TABLE_BYTES)
+    assert np.array_equal(per_pixel, color_table)
+
+
+@pytest.mark.parametrize("memory_budget", [16 << 20, 2 * COLOR_TABLE_BYTES])
+def test_peak_memory_stays_near_the_budget(lut, large_image, memory_budget):
+    out = np.empty_like(large_image)
+    tracemalloc.start()
+    try:
+        apply_lut(large_image, lut, out=out, memory_budget=memory_budget)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < memory_budget * 1.1
+
+
+def test_identity_lut_round_trips_16_bit_images():
+    image = np.random.default_rng(16).integers(0, 1 << 16, (64, 48, 3), dtype=np.uint16)
+    identity = LutFile(lut_3d=main.create_identity_lattice(9).astype(np.float32))
+    assert np.array_equal(apply_lut(image, identity, "tetrahedral"), image)
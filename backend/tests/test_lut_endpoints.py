@@ -0,0 +1,223 @@
+import asyncio
+import io
+import json
+import zipfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers, UploadFile
+
+import main
+from lut_io import read_cube
+
+INVALID_CUBES = {
+    "size_one": "LUT_3D_SIZE 1\n0.5 0.5 0.5\n",
+    "short_domain": "LUT_3D_SIZE 2\nDOMAIN_MIN 0 0\n" + "0.000000 0.000000 0.000000\n" * 8,
+}
+
+
+class OrangeTealModel:
+    """Fake Gemini model that always recommends orange_teal"""
+
+    calls = 0
+
+    def __init__(self, model_name: str, *args, **kwargs):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, generation_config=None):
+        OrangeTealModel.calls += 1
+        return SimpleNamespace(text=(
+            '{"analysis": "fake", "cinematic_look": "orange_teal", "method": "mkl", "confidence": 0.9}'
+        ))
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("name", INVALID_CUBES)
+def test_analyze_lut_rejects_invalid_cube(client, name):
+    response = client.post("/api/analyze-lut", files={"file": ("bad.cube", INVALID_CUBES[name], "text/plain")})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("name", INVALID_CUBES)
+def test_apply_lut_rejects_invalid_cube(client, image_bytes, name):
+    response = client.post("/api/apply-lut", files={
+        "file": ("image.png", image_bytes(12), "image/png"),
+        "lut": ("bad.cube", INVALID_CUBES[name], "text/plain"),
+    })
+    assert response.status_code == 400
+
+
+def test_analyze_lut_reports_identity(client):
+    identity = main.lut_to_cube(main.create_identity_lattice(5))
+    response = client.post("/api/analyze-lut", files={"file": ("identity.cube", identity, "text/plain")})
+    assert response.status_code == 200
+    assert response.json()["max_change"] < 1e-6
+
+
+def test_apply_lut_caches_generated_cube(client, image_bytes, monkeypatch):
+    monkeypatch.setattr(main.genai, "GenerativeModel", OrangeTealModel)
+    upload = image_bytes(13013)
+    response = client.post(
+        "/api/apply-lut?size=17&output_format=png", files={"file": ("image.png", upload, "image/png")}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+
+    analysis = main.analysis_cache.get(main.content_hash(upload))
+    cube_content = main.lut_cache.get(
+        main.lut_cache_key(main.content_hash(upload), main.ColorMatcherResponse(**analysis), 17)
+    )
+    assert read_cube(cube_content).lut_3d.shape == (17, 17, 17, 3)
+
+
+def server_sent_events(body: str) -> list:
+    """Parse a text/event-stream body into (event, data) pairs"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_progressive_generate_lut_sends_preview_then_lut(client, image_bytes, monkeypatch):
+    monkeypatch.setattr(main.genai, "GenerativeModel", OrangeTealModel)
+    response = client.post(
+        "/api/generate-lut?progressive=true&size=17", files={"file": ("image.png", image_bytes(19019), "image/png")}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = server_sent_events(response.text)
+    assert [event for event, _ in events] == ["preview", "lut"]
+    preview, lut = events[0][1], events[1][1]
+    assert preview["size"] == main.PREVIEW_LUT_SIZE
+    assert read_cube(preview["cube"]).lut_3d.shape == (17, 17, 17, 3)
+    assert lut["analysis"]["cinematic_look"] == "orange_teal"
+    assert read_cube(lut["cube"]).lut_3d.shape == (17, 17, 17, 3)
+
+
+def test_progressive_generate_lut_is_refused_when_pool_is_full(client, image_bytes, monkeypatch):
+    monkeypatch.setattr(main, "lut_jobs_in_flight", max(main.LUT_WORKERS, 1) + main.LUT_MAX_QUEUED_JOBS)
+    response = client.post(
+        "/api/generate-lut?progressive=true", files={"file": ("image.png", image_bytes(19020), "image/png")}
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+class BrokenExecutor(Executor):
+    """Executor standing in for a process pool whose worker died"""
+
+    def submit(self, fn, *args, **kwargs):
+        raise BrokenProcessPool("A process in the process pool was terminated abruptly")
+
+
+def test_broken_worker_pool_is_replaced(client, image_bytes, monkeypatch):
+    monkeypatch.setattr(main.genai, "GenerativeModel", OrangeTealModel)
+    replacement = ThreadPoolExecutor(1)
+    monkeypatch.setattr(main, "lut_executor", BrokenExecutor())
+    monkeypatch.setattr(main, "start_lut_executor", lambda: replacement)
+    try:
+        upload = image_bytes(7007)
+        response = client.post("/api/generate-lut", files={"file": ("image.png", upload, "image/png")})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert main.lut_executor is replacement
+
+        response = client.post("/api/generate-lut", files={"file": ("image.png", upload, "image/png")})
+        assert response.status_code == 200
+    finally:
+        replacement.shutdown()
+
+
+def test_unreadable_upload_is_rejected_before_gemini(client, monkeypatch):
+    monkeypatch.setattr(main.genai, "GenerativeModel", OrangeTealModel)
+    OrangeTealModel.calls = 0
+    response = client.post("/api/generate-lut", files={"file": ("image.png", b"not an image", "image/png")})
+    assert response.status_code == 400
+    assert OrangeTealModel.calls == 0
+
+
+def test_generate_shoot_lut_uses_the_grading_engine(client, image_bytes):
+    fallbacks = main.lut_fallback_count.value
+    files = [("files", (f"shot-{seed}.png", image_bytes(seed), "image/png")) for seed in (17001, 17002, 17003)]
+    response = client.post("/api/generate-shoot-lut?look=orange_teal&size=17", files=files)
+    assert response.status_code == 200
+
+    assert read_cube(response.json()).lut_3d.shape == (17, 17, 17, 3)
+    # The grading engine built it, not the adaptive fallback
+    assert main.lut_fallback_count.value == fallbacks
+
+
+def test_generate_luts_streams_a_cube_per_upload_and_a_manifest(client, image_bytes, monkeypatch):
+    monkeypatch.setattr(main.genai, "GenerativeModel", OrangeTealModel)
+    files = [
+        ("files", ("first.png", image_bytes(16001), "image/png")),
+        ("files", ("broken.png", b"not an image", "image/png")),
+        ("files", ("second.png", image_bytes(16002), "image/png")),
+    ]
+    response = client.post("/api/generate-luts?size=17", files=files)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == ["first.cube", "manifest.json", "second.cube"]
+        for name in ("first.cube", "second.cube"):
+            assert read_cube(archive.read(name).decode()).lut_3d.shape == (17, 17, 17, 3)
+        manifest = json.loads(archive.read("manifest.json"))
+
+    assert [entry["file"] for entry in manifest] == ["first.png", "broken.png", "second.png"]
+    assert manifest[0]["lut"] == "first.cube" and manifest[0]["cinematic_look"] == "orange_teal"
+    assert "Invalid image file" in manifest[1]["error"]
+    assert manifest[2]["lut"] == "second.cube"
+
+
+class HangingModel:
+    """Fake Gemini model that never answers, recording when its call is cancelled"""
+
+    cancelled = False
+
+    def __init__(self, model_name: str, *args, **kwargs):
+        self.model_name = model_name
+
+    async def generate_content_async(self, contents, generation_config=None):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            HangingModel.cancelled = True
+            raise
+
+
+def test_generate_luts_cancels_pending_uploads_when_the_client_leaves(image_bytes, monkeypatch):
+    monkeypatch.setattr(main.genai, "GenerativeModel", HangingModel)
+    HangingModel.cancelled = False
+    # The first upload is served from the caches, the second waits on Gemini forever
+    ready, pending = image_bytes(16003), image_bytes(16004)
+    analysis = main.ColorMatcherResponse(analysis="cached", cinematic_look="orange_teal", method="mkl", confidence=0.9)
+    main.analysis_cache.set(main.content_hash(ready), analysis.model_dump())
+    main.lut_cache.set(
+        main.lut_cache_key(main.content_hash(ready), analysis, 17),
+        main.lut_to_cube(main.create_identity_lattice(17))
+    )
+
+    def upload(name: str, data: bytes) -> UploadFile:
+        return UploadFile(io.BytesIO(data), filename=name, headers=Headers({"content-type": "image/png"}))
+
+    async def disconnect_after_first_entry():
+        response = await main.generate_luts([upload("ready.png", ready), upload("pending.png", pending)], size=17)
+        body = response.body_iterator
+        assert await body.__anext__()
+        await body.aclose()
+        # Let the cancelled Gemini call unwind
+        await asyncio.sleep(0)
+
+    asyncio.run(disconnect_after_first_entry())
+    assert HangingModel.cancelled
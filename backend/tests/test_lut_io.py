@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import main
+from lut_io import read_3dl, read_cube, read_lut
+
+
+def random_lut(size: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).random((size, size, size, 3)).astype(np.float32)
+
+
+def cube_rows(values: np.ndarray) -> str:
+    return "".join(f"{r:.6f} {g:.6f} {b:.6f}\n" for r, g, b in values.reshape(-1, 3))
+
+
+@pytest.mark.parametrize("size", [2, 17, 33, 65])
+def test_read_cube_round_trips_lut_to_cube(size):
+    lut = random_lut(size, seed=size)
+    parsed = read_cube(main.lut_to_cube(lut))
+    assert parsed.lut_1d is None
+    assert parsed.lut_3d.shape == (size, size, size, 3)
+    np.testing.assert_allclose(parsed.lut_3d, lut, atol=1e-6)
+
+
+def test_read_cube_round_trips_adaptive_lut():
+    lut = main.create_adaptive_lut(main.get_reference_analysis("orange_teal"), 17)
+    np.testing.assert_allclose(read_cube(main.lut_to_cube(lut)).lut_3d, lut, atol=1e-6)
+
+
+def test_read_cube_1d():
+    shaper = np.array([[0.0, 0.0, 0.0], [0.2, 0.3, 0.4], [1.0, 0.9, 0.8]])
+    parsed = read_cube('TITLE "curve"\nLUT_1D_SIZE 3\n' + cube_rows(shaper))
+    assert parsed.title == "curve"
+    assert parsed.lut_3d is None
+    np.testing.assert_allclose(parsed.lut_1d, shaper, atol=1e-6)
+
+
+def test_read_cube_shaper_and_3d():
+    shaper = np.array([[0.0, 0.0, 0.0], [0.5, 0.5, 0.5], [1.0, 1.0, 1.0]])
+    lut = random_lut(2, seed=1)
+    parsed = read_cube("LUT_1D_SIZE 3\nLUT_3D_SIZE 2\n" + cube_rows(shaper) + cube_rows(lut))
+    np.testing.assert_allclose(parsed.lut_1d, shaper, atol=1e-6)
+    np.testing.assert_allclose(parsed.lut_3d, lut, atol=1e-6)
+
+
+def test_read_cube_domain():
+    lut = random_lut(2, seed=2)
+    parsed = read_cube("LUT_3D_SIZE 2\nDOMAIN_MIN -0.1 0 0.05\nDOMAIN_MAX 1.5 1 2\n" + cube_rows(lut))
+    np.testing.assert_allclose(parsed.domain_min, [-0.1, 0, 0.05])
+    np.testing.assert_allclose(parsed.domain_max, [1.5, 1, 2])
+
+    parsed = read_cube("LUT_3D_INPUT_RANGE 0 4\nLUT_3D_SIZE 2\n" + cube_rows(lut))
+    np.testing.assert_allclose(parsed.domain_min, [0, 0, 0])
+    np.testing.assert_allclose(parsed.domain_max, [4, 4, 4])
+
+
+def test_read_3dl_with_mesh_header():
+    size = 5  # "Mesh 2 12": 2^2 + 1 input points, 12-bit output
+    lut = random_lut(size, seed=3)
+    codes = np.round(lut.astype(np.float64) * 4095).astype(int)
+    content = (
+        "Mesh 2 12\n"
+        + " ".join(str(value) for value in np.round(np.linspace(0, 1023, size)).astype(int)) + "\n"
+        + "".join(f"{r} {g} {b}\n" for r, g, b in codes.reshape(-1, 3))
+    )
+    parsed = read_3dl(content)
+    np.testing.assert_allclose(parsed.lut_3d, codes / 4095, atol=1e-6)
+    np.testing.assert_allclose(read_lut(content, "grade.3dl").lut_3d, parsed.lut_3d)
+
+
+@pytest.mark.parametrize("header", ["LUT_3D_SIZE 1", "LUT_1D_SIZE 1", "LUT_3D_SIZE 0"])
+def test_read_cube_rejects_sizes_below_two(header):
+    with pytest.raises(ValueError, match="at least 2"):
+        read_cube(f"{header}\n0.5 0.5 0.5\n")
+
+
+@pytest.mark.parametrize("keyword", ["DOMAIN_MIN", "DOMAIN_MAX"])
+@pytest.mark.parametrize("values", ["0 0", "0 0 0 0"])
+def test_read_cube_rejects_domains_without_three_values(keyword, values):
+    with pytest.raises(ValueError, match="needs 3 values"):
+        read_cube(f"LUT_3D_SIZE 2\n{keyword} {values}\n" + cube_rows(random_lut(2)))
@@ -0,0 +1,36 @@
+import asyncio
+import os
+
+from result_cache import DISK_PRUNE_TARGET, ResultCache
+
+
+def test_disk_entries_are_shared_between_instances(tmp_path):
+    writer = ResultCache("lut", 8, 60, str(tmp_path))
+    writer.set("key", "LUT_3D_SIZE 2")
+    writer.flush()
+
+    reader = ResultCache("lut", 8, 60, str(tmp_path))
+    assert asyncio.run(reader.get_async("key")) == "LUT_3D_SIZE 2"
+    assert reader.stats()["hits"] == 1
+    # Now held in memory too
+    assert reader.stats()["entries"] == 1
+
+
+def test_missing_keys_are_counted_as_misses(tmp_path):
+    cache = ResultCache("analysis", 8, 60, str(tmp_path))
+    assert asyncio.run(cache.get_async("missing")) is None
+    assert cache.get("missing") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_disk_is_pruned_to_the_least_recently_used(tmp_path):
+    cache = ResultCache("lut", 10, 60, str(tmp_path))
+    for index in range(11):
+        cache.set(f"key-{index}", index)
+        cache.flush()
+        # Distinct mtimes, oldest first
+        os.utime(cache._path(f"key-{index}"), (index, index))
+
+    files = sorted(os.listdir(cache.directory))
+    assert len(files) == int(10 * DISK_PRUNE_TARGET)
+    assert "key-10.json" in files and "key-0.json" not in files
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from stage_timing import StageTimingMiddleware, current_timings, span
+
+
+async def timed_app(scope, receive, send):
+    with span("work"):
+        await asyncio.sleep(0)
+    timed = str(current_timings() is not None).encode()
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"x-timed", timed)]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def run_request(middleware) -> dict:
+    """Send one GET through the middleware and return its response start message"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/"}, receive, send))
+    return messages[0]
+
+
+@pytest.mark.parametrize("stages", [True, False])
+def test_stages_are_timed_only_when_enabled(stages):
+    completed = []
+    middleware = StageTimingMiddleware(
+        timed_app,
+        server_timing=stages,
+        on_complete=lambda scope, status, total, durations: completed.append((status, durations)),
+        stages=stages
+    )
+    headers = dict(run_request(middleware)["headers"])
+
+    assert headers[b"x-timed"] == str(stages).encode()
+    status, durations = completed[0]
+    assert status == 200
+    if stages:
+        assert set(durations) == {"work"}
+        assert headers[b"server-timing"].startswith(b"work;dur=")
+    else:
+        assert durations == {}
+        assert b"server-timing" not in headers
@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+
+class TileScheduler:
+    """Runs per-pixel image stages over row bands on a shared thread pool
+
+    NumPy ufuncs, np.take and most OpenCV kernels release the GIL, so the bands of one image
+    run in parallel on threads without copying the image to other processes. With one thread
+    bands run inline on the calling thread.
+    """
+
+    def __init__(self, threads: int, tile_rows: int):
+        self.threads = max(threads, 1)
+        self.tile_rows = max(tile_rows, 1)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def bands(self, height: int, tile_rows: Optional[int] = None) -> List[slice]:
+        """Split height rows into consecutive bands of at most tile_rows rows"""
+        rows = tile_rows or self.tile_rows
+        return [slice(start, min(start + rows, height)) for start in range(0, height, rows)]
+
+    def map(self, func: Callable[[slice], Any], height: int, tile_rows: Optional[int] = None) -> list:
+        """Call func(band) for every row band and return the results in band order"""
+        bands = self.bands(height, tile_rows)
+        if self.threads == 1 or len(bands) == 1:
+            return [func(band) for band in bands]
+        return list(self._get_executor().map(func, bands))
+
+    def map_reduce(self, func: Callable[[slice], dict], height: int, tile_rows: Optional[int] = None) -> dict:
+        """Call func(band) for every row band and sum the partial statistics it returns"""
+        return sum_partials(self.map(func, height, tile_rows))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="tile")
+            return self._executor
+
+
+def sum_partials(partials: List[dict]) -> dict:
+    """Merge per-band statistics (dicts of counts, sums and arrays of sums) by adding them"""
+    merged = dict(partials[0])
+    for partial in partials[1:]:
+        for key, value in partial.items():
+            merged[key] = merged[key] + value
+    return merged